@@ -0,0 +1,334 @@
+import json
+import platform
+import subprocess
+import numpy as np
+import networkx as nx
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from io import StringIO
+from math import ceil, sqrt
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from TransitGraph import TransitGraph as TG
+from Simulator import Simulator
+from Scheduler import schedule_disruptions
+
+DEFAULT_PATH = 'benchmark_results.json'
+
+'''
+Disruptions of the Vienna network used by the simulation & scheduling benchmarks.
+'''
+vienna_disruption = 'Karlsplatz'
+vienna_schedule = [
+	'Karlsplatz', 'Praterstern', 'Ottakring', 'Simmering', 'Leopoldau', 'Oberlaa', 'Heiligenstadt',
+	['Schottentor', 'Rathausplatz/Burgtheater']
+]
+
+
+'''
+# of stations up to which the routing & simulation benchmarks use their full # of queries &
+journeys. A journey takes longer the larger the network, so larger networks get
+proportionally fewer, see `scaled_count`.
+'''
+full_count_stations = 1_000
+
+
+def scaled_count(count: int, stations: int) -> int:
+	"""
+	The # of queries or journeys to run on a network, which keeps the time per benchmark roughly
+	the same on networks larger than `full_count_stations`.
+	"""
+	return max(1, count * full_count_stations // max(stations, full_count_stations))
+
+
+def synthetic_network(station_count: int, seed: int = 0, routing: str = 'heuristic') -> TG:
+	"""
+	Generates a grid shaped network for benchmarking at scales beyond Vienna. Every row of the
+	grid is served by a tram line & every 4th column by a metro line. Commuter lines take a
+	random walk from the left to the right edge, sharing segments with the other lines.
+	Stations are named `x-y` after their position in the grid.
+	:param station_count: # of stations, filled in row by row
+	:param seed: Seed of the commuter lines
+	:param routing: see `TransitGraph.__init__()` for docs
+	"""
+	random = Random(seed)
+	width = ceil(sqrt(station_count))
+	height = ceil(station_count / width)
+	
+	def station(x: int, y: int) -> str | None:
+		return f'{x}-{y}' if y * width + x < station_count else None
+	
+	with TemporaryDirectory() as empty_folder:
+		net = TG(routing=routing, graph_cache=None, line_folder=empty_folder)
+	
+	def add_line(line_name: str, stations: list[str | None], line_type: str) -> None:
+		stations = [station_name for station_name in stations if station_name is not None]
+		if len(stations) > 1:
+			net.add_lines(line_name, stations, custom_type=line_type)
+	
+	for y in range(height):
+		add_line(f'T{y}', [station(x, y) for x in range(width)], 'tram')
+	for x in range(0, width, 4):
+		add_line(f'M{x}', [station(x, y) for y in range(height)], 'metro')
+	
+	for line_index in range(max(1, height // 8)):
+		y = random.randrange(height)
+		walk = [station(0, y)]
+		for x in range(1, width):
+			y = min(max(y + random.choice([-1, 0, 1]), 0), height - 1)
+			walk.append(station(x, y))
+		add_line(f'C{line_index}', walk, 'commuter')
+	
+	return net
+
+
+def latency_summary(seconds: list[float]) -> dict:
+	"""
+	Percentiles of a list of durations in milliseconds.
+	"""
+	milliseconds = np.array(seconds) * 1000
+	return {
+		'p50_ms': float(np.percentile(milliseconds, 50)),
+		'p90_ms': float(np.percentile(milliseconds, 90)),
+		'p99_ms': float(np.percentile(milliseconds, 99)),
+		'mean_ms': float(milliseconds.mean()),
+		'max_ms': float(milliseconds.max()),
+	}
+
+
+def bench_fastest_path(net: TG, network: str, method: str, queries: int, seed: int) -> dict:
+	"""
+	Latency distribution of `TransitGraph.fastest_path` over random origin & target pairs.
+	"""
+	random = Random(seed)
+	stations = sorted(net.nodes)
+	pairs = [random.sample(stations, k=2) for _ in range(queries)]
+	
+	# builds the compact graph of `csr` outside of the timing
+	net.fastest_path(*pairs[0], sim_mode=True, method=method)
+	
+	seconds = []
+	unreachable = 0
+	for source, target in pairs:
+		start = perf_counter()
+		try:
+			net.fastest_path(source, target, sim_mode=True, method=method)
+		except nx.NetworkXNoPath:
+			unreachable += 1
+		seconds.append(perf_counter() - start)
+	
+	return {
+		'benchmark': 'fastest_path',
+		'network': network,
+		'stations': net.number_of_nodes(),
+		'method': method,
+		'queries': queries,
+		'unreachable': unreachable,
+		**latency_summary(seconds),
+	}
+
+
+def check_equivalence(net: TG, network: str, method: str, queries: int, seed: int) -> dict:
+	"""
+	Compares the journey times of an exact routing method with those of `raptor` over random
+	origin & target pairs, see `TransitGraph.exact_routing_methods`. The journeys themselves
+	can differ, but never their times.
+	"""
+	random = Random(seed)
+	stations = sorted(net.nodes)
+	mismatches = 0
+	for _ in range(queries):
+		source, target = random.sample(stations, k=2)
+		times = []
+		for routing in [method, 'raptor']:
+			try:
+				times.append(net.fastest_path(source, target, sim_mode=True, method=routing)[1])
+			except nx.NetworkXNoPath:
+				times.append(None)
+		if None in times:
+			mismatches += times[0] != times[1]
+		elif abs(times[0] - times[1]) > 1e-9:
+			mismatches += 1
+	
+	if mismatches:
+		print(f'Warning: {method} differs from raptor on {mismatches} of {queries} journeys')
+	return {
+		'benchmark': 'equivalence',
+		'network': network,
+		'stations': net.number_of_nodes(),
+		'method': method,
+		'queries': queries,
+		'mismatches': mismatches,
+	}
+
+
+def bench_simulation(
+	net: TG,
+	network: str,
+	method: str,
+	journeys: int,
+	disruption: str,
+	seed: int
+) -> dict:
+	"""
+	Throughput of `Simulator.simulate_journeys` & `Simulator.simulate_disruption`. The network
+	is swapped into the simulator, so this always runs in a single process.
+	"""
+	sim = Simulator(journeys, loading_bars=False, routing=method, seed=seed)
+	net.routing = method
+	sim.net = net
+	
+	start = perf_counter()
+	sim.simulate_journeys()
+	journeys_seconds = perf_counter() - start
+	
+	sim.disrupt(disruption)
+	start = perf_counter()
+	sim.simulate_disruption()
+	disruption_seconds = perf_counter() - start
+	stats = sim.get_stats()
+	net.clear_disruptions()
+	
+	return {
+		'benchmark': 'simulation',
+		'network': network,
+		'stations': net.number_of_nodes(),
+		'method': method,
+		'journeys': journeys,
+		'disruption': disruption,
+		'simulate_journeys_seconds': journeys_seconds,
+		'simulate_journeys_per_second': journeys / journeys_seconds,
+		'simulate_disruption_seconds': disruption_seconds,
+		'rerouted_journeys': len(sim.affected_journeys()),
+		'score': float(stats['score']),
+	}
+
+
+def bench_schedule(method: str, journeys: int, seed: int) -> dict:
+	"""
+	End to end run of `schedule_disruptions` on the Vienna network.
+	"""
+	start = perf_counter()
+	# the recommended order is printed, which is not part of the results
+	with redirect_stdout(StringIO()):
+		schedule_disruptions(
+			vienna_schedule, 2, journeys, routing=method, seed=seed, loading_bars=False
+		)
+	
+	return {
+		'benchmark': 'schedule',
+		'network': 'vienna',
+		'method': method,
+		'journeys': journeys,
+		'disruptions': len(vienna_schedule),
+		'seconds': perf_counter() - start,
+	}
+
+
+def run_benchmarks(
+	scales: list[str],
+	methods: list[str],
+	queries: int = 100,
+	journeys: int = 1_000,
+	seed: int = 0,
+	heuristic_limit: int = 1_000,
+	schedule: bool = True
+) -> dict:
+	"""
+	Runs every benchmark on every network.
+	:param scales: `vienna` or a # of stations of a `synthetic_network`
+	:param methods: The routing methods to benchmark, see `TransitGraph.routing_methods`.
+		`table` is left out, since a route table grows with the square of the # of stations.
+	:param queries: # of journeys routed per fastest path benchmark & equivalence check, scaled
+		down for large networks, see `scaled_count`
+	:param journeys: # of journeys per simulation & scheduling benchmark, scaled down for
+		large networks like `queries`
+	:param seed: Seed of all journeys & synthetic networks, so runs are comparable
+	:param heuristic_limit: Skip the `heuristic` method on networks larger than this
+	:param schedule: Also run the end to end scheduling benchmark
+	:return: The environment & the result of each benchmark.
+	"""
+	results = []
+	for scale in scales:
+		if scale == 'vienna':
+			net = TG()
+			disruption = vienna_disruption
+		else:
+			net = synthetic_network(int(scale), seed)
+			width = ceil(sqrt(int(scale)))
+			# a station served by a metro line near the center
+			disruption = f'{width // 8 * 4}-{int(scale) // width // 2}'
+		
+		scale_queries = scaled_count(queries, net.number_of_nodes())
+		scale_journeys = scaled_count(journeys, net.number_of_nodes())
+		for method in methods:
+			if method == 'heuristic' and net.number_of_nodes() > heuristic_limit:
+				continue
+			print(f'{scale}: {method}')
+			results.append(bench_fastest_path(net, scale, method, scale_queries, seed))
+			if method in TG.exact_routing_methods and method != 'raptor':
+				results.append(check_equivalence(net, scale, method, scale_queries, seed))
+			results.append(bench_simulation(net, scale, method, scale_journeys, disruption, seed))
+	
+	if schedule:
+		for method in methods:
+			print(f'schedule: {method}')
+			results.append(bench_schedule(method, journeys, seed))
+	
+	try:
+		commit = subprocess.run(
+			['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+	
+	return {
+		'commit': commit,
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'seed': seed,
+		'results': results,
+	}
+
+
+def compare_results(baseline: dict, current: dict) -> None:
+	"""
+	Prints the ratio of every timing of 2 benchmark runs, where a ratio above 1 is slower.
+	"""
+	def key(result: dict) -> tuple:
+		return result['benchmark'], result['network'], result['method']
+	
+	baseline_results = {key(result): result for result in baseline['results']}
+	for result in current['results']:
+		if key(result) not in baseline_results:
+			continue
+		for metric, value in result.items():
+			if metric.endswith('_ms') or metric.endswith('seconds'):
+				ratio = value / baseline_results[key(result)][metric]
+				print(f'{" ".join(key(result))} {metric}: {ratio:.2f}x')
+
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description='Benchmarks routing, simulation & scheduling.')
+	parser.add_argument('--scales', nargs='+', default=['vienna', '1000', '10000'])
+	parser.add_argument('--methods', nargs='+', default=['heuristic', 'line_expanded', 'astar', 'csr', 'raptor'])
+	parser.add_argument('--queries', type=int, default=100)
+	parser.add_argument('--journeys', type=int, default=1_000)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--heuristic-limit', type=int, default=1_000)
+	parser.add_argument('--no-schedule', action='store_true')
+	parser.add_argument('--output', default=DEFAULT_PATH)
+	parser.add_argument('--compare', help='results of an earlier run to compare against')
+	args = parser.parse_args()
+	
+	run = run_benchmarks(
+		args.scales, args.methods, args.queries, args.journeys, args.seed,
+		args.heuristic_limit, not args.no_schedule
+	)
+	with open(args.output, 'w') as file:
+		json.dump(run, file, indent='\t')
+	
+	if args.compare is not None:
+		with open(args.compare) as file:
+			compare_results(json.load(file), run)
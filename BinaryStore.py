@@ -0,0 +1,67 @@
+import json
+import numpy as np
+
+'''
+Every binary file starts with these bytes, followed by the length of the JSON header as a
+little endian uint32, the header itself & finally the arrays. Each array is aligned to 8 bytes
+so it can be viewed directly from a memory map.
+'''
+MAGIC = b'DSRP'
+ALIGNMENT = 8
+
+
+def write_store(path: str, header: dict, arrays: dict[str, np.ndarray]) -> None:
+	"""
+	Writes a JSON header & a number of flat NumPy arrays into a single binary file.
+	:param path: The file to write
+	:param header: Any JSON serializable information, stored under the key `header`.
+	:param arrays: The arrays to store by name. These are flattened when written.
+	"""
+	layout = {}
+	offset = 0
+	for name, array in arrays.items():
+		layout[name] = {'dtype': array.dtype.str, 'count': int(array.size), 'offset': offset}
+		offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+	
+	header_bytes = json.dumps({'header': header, 'arrays': layout}).encode()
+	header_bytes += b' ' * (-(len(MAGIC) + 4 + len(header_bytes)) % ALIGNMENT)
+	
+	with open(path, 'wb') as file:
+		file.write(MAGIC)
+		file.write(np.uint32(len(header_bytes)).tobytes())
+		file.write(header_bytes)
+		for name, array in arrays.items():
+			data = np.ascontiguousarray(array).tobytes()
+			file.write(data)
+			file.write(b'\0' * (-len(data) % ALIGNMENT))
+
+
+def read_store(path: str, memory_map: bool = True) -> tuple[dict, dict[str, np.ndarray]]:
+	"""
+	Reads a file written by `write_store`.
+	:param path: The file to read
+	:param memory_map: Map the file instead of reading it. The arrays are then read-only &
+		their pages are shared between all processes reading the same file.
+	:return: The header & the arrays by name.
+	:raise ValueError: If the file is not in the expected format.
+	"""
+	if memory_map:
+		buffer = np.memmap(path, dtype=np.uint8, mode='r')
+	else:
+		with open(path, 'rb') as file:
+			buffer = np.frombuffer(file.read(), dtype=np.uint8)
+	
+	if buffer[:len(MAGIC)].tobytes() != MAGIC:
+		raise ValueError(f'{path} is not a valid binary store')
+	header_start = len(MAGIC) + 4
+	header_length = int(buffer[len(MAGIC):header_start].view('<u4')[0])
+	content = json.loads(buffer[header_start:header_start + header_length].tobytes())
+	
+	data_start = header_start + header_length
+	arrays = {}
+	for name, spec in content['arrays'].items():
+		dtype = np.dtype(spec['dtype'])
+		start = data_start + spec['offset']
+		arrays[name] = buffer[start:start + spec['count'] * dtype.itemsize].view(dtype)
+	
+	return content['header'], arrays
@@ -0,0 +1,334 @@
+import numpy as np
+import networkx as nx
+from heapq import heappush, heappop
+
+
+class CompactGraph:
+	def __init__(self,
+		stations: list[str],
+		lines: list[str],
+		line_types: list[str],
+		line_frequencies: np.ndarray,
+		offsets: np.ndarray,
+		neighbors: np.ndarray,
+		travel_times: np.ndarray,
+		edge_line_sets: np.ndarray,
+		line_set_offsets: np.ndarray,
+		line_set_lines: np.ndarray
+	):
+		"""
+		Integer indexed compressed sparse row (CSR) form of a `TransitGraph`, used by the `csr`
+		routing method. Stations, lines & the distinct sets of lines serving a segment are
+		numbered, so the routing kernel only deals with integers & flat arrays. Every segment
+		is stored once per direction: the segments of station `i` are at the indices
+		`offsets[i]` to `offsets[i + 1]` of `neighbors`, `travel_times` & `edge_line_sets`.
+		Usually created by `CompactGraph.from_graph`.
+		:param stations: Station names by id
+		:param lines: Line names by id
+		:param line_types: The type of each line
+		:param line_frequencies: Trains per hour of each line
+		:param offsets: Start of the segments of each station, with a final end offset
+		:param neighbors: The station at the other end of each segment
+		:param travel_times: The travel time of each segment
+		:param edge_line_sets: The id of the set of lines serving each segment
+		:param line_set_offsets: Start of each set of lines in `line_set_lines`, with a final
+			end offset
+		:param line_set_lines: The line ids of all sets of lines, concatenated
+		"""
+		self.stations = stations
+		self.station_ids = {station: index for index, station in enumerate(stations)}
+		self.lines = lines
+		self.line_types = line_types
+		self.line_frequencies = line_frequencies
+		
+		self.offsets = offsets
+		self.neighbors = neighbors
+		self.travel_times = travel_times
+		self.edge_line_sets = edge_line_sets
+		self.line_set_offsets = line_set_offsets
+		self.line_set_lines = line_set_lines
+		
+		# plain lists of the arrays for the kernel, indexing them is much faster than NumPy
+		self._offsets = offsets.tolist()
+		self._neighbors = neighbors.tolist()
+		self._travel_times = travel_times.tolist()
+		self._edge_line_sets = edge_line_sets.tolist()
+		self._line_frequencies = line_frequencies.tolist()
+		
+		'''
+		Line sets are split into groups of a single line type, which are the states of the
+		search. Groups are numbered as they are created, including the intersections of groups
+		found while riding on.
+		'''
+		self.line_sets: list[frozenset[int]] = []
+		self.line_set_ids: dict[frozenset[int], int] = {}
+		self.line_set_groups: list[tuple[int, ...]] = []
+		self.groups: list[frozenset[int]] = []
+		self.group_ids: dict[frozenset[int], int] = {}
+		self.group_types: list[str] = []
+		self.group_waits: list[float] = []
+		self._intersections: dict[tuple[int, int], int] = {}
+		
+		set_offsets = line_set_offsets.tolist()
+		set_lines = line_set_lines.tolist()
+		for index in range(len(set_offsets) - 1):
+			self.line_set_id(frozenset(set_lines[set_offsets[index]:set_offsets[index + 1]]))
+	
+	@classmethod
+	def from_graph(cls, net) -> 'CompactGraph':
+		"""
+		Exports the undisrupted network of a `TransitGraph`.
+		:param net: The transit graph to export. Its disruptions are not included, these are
+			passed to `self.search` instead.
+		"""
+		stations = sorted(net.nodes)
+		station_ids = {station: index for index, station in enumerate(stations)}
+		lines = sorted(net.line_types)
+		line_ids = {line: index for index, line in enumerate(lines)}
+		
+		line_set_ids: dict[frozenset[int], int] = {}
+		offsets = [0]
+		neighbors, travel_times, edge_line_sets = [], [], []
+		for station in stations:
+			for neighbor in sorted(net.adj[station], key=station_ids.get):
+				segment = net[station][neighbor]
+				line_set = frozenset(line_ids[line] for line in segment['lines'])
+				neighbors.append(station_ids[neighbor])
+				travel_times.append(segment['travel_time'])
+				edge_line_sets.append(line_set_ids.setdefault(line_set, len(line_set_ids)))
+			offsets.append(len(neighbors))
+		
+		line_set_offsets = [0]
+		line_set_lines = []
+		for line_set in line_set_ids:
+			line_set_lines.extend(sorted(line_set))
+			line_set_offsets.append(len(line_set_lines))
+		
+		return cls(
+			stations=stations,
+			lines=lines,
+			line_types=[net.line_types[line] for line in lines],
+			line_frequencies=np.array([60 / net.line_wait_time(line) for line in lines]),
+			offsets=np.array(offsets, dtype=np.int32),
+			neighbors=np.array(neighbors, dtype=np.int32),
+			travel_times=np.array(travel_times, dtype=np.float64),
+			edge_line_sets=np.array(edge_line_sets, dtype=np.int32),
+			line_set_offsets=np.array(line_set_offsets, dtype=np.int32),
+			line_set_lines=np.array(line_set_lines, dtype=np.int32),
+		)
+	
+	def line_set_id(self, line_set: frozenset[int]) -> int:
+		"""
+		The id of a set of line ids, registering it along with its groups if it is new.
+		"""
+		if line_set not in self.line_set_ids:
+			by_type: dict[str, set[int]] = {}
+			for line in sorted(line_set):
+				by_type.setdefault(self.line_types[line], set()).add(line)
+			self.line_set_ids[line_set] = len(self.line_sets)
+			self.line_sets.append(line_set)
+			self.line_set_groups.append(
+				tuple(self._group_id(frozenset(group)) for group in by_type.values())
+			)
+		return self.line_set_ids[line_set]
+	
+	def _group_id(self, group: frozenset[int]) -> int:
+		"""
+		The id of a group of lines of the same type, registering it if it is new.
+		"""
+		if group not in self.group_ids:
+			self.group_ids[group] = len(self.groups)
+			self.groups.append(group)
+			self.group_types.append(self.line_types[next(iter(group))])
+			# same as `TransitGraph.segment_wait_time`
+			self.group_waits.append(30 / sum(self._line_frequencies[line] for line in group))
+		return self.group_ids[group]
+	
+	def _intersect(self, group1: int, group2: int) -> int:
+		"""
+		The id of the intersection of 2 groups, or -1 if they share no lines.
+		"""
+		key = (group1, group2)
+		if key not in self._intersections:
+			shared = self.groups[group1] & self.groups[group2]
+			self._intersections[key] = self._group_id(shared) if shared else -1
+		return self._intersections[key]
+	
+	def edge_index(self, station1: int, station2: int) -> int:
+		"""
+		The index of the segment from station1 to station2 in the segment arrays.
+		:raise KeyError: If the stations are not adjacent.
+		"""
+		for index in range(self._offsets[station1], self._offsets[station1 + 1]):
+			if self._neighbors[index] == station2:
+				return index
+		raise KeyError(f'{self.stations[station1]} - {self.stations[station2]}')
+	
+	def overlay(self,
+		removed_stations: set[str],
+		removed_segments: set[frozenset],
+		removed_lines: dict[frozenset, set[str]]
+	) -> tuple[set[int], dict[int, int]]:
+		"""
+		Translates the disruption overlay of a `TransitGraph` for `self.search`.
+		:return: The removed station ids & the line set id of each disrupted segment by its
+			index in both directions, where -1 marks a removed segment.
+		"""
+		line_ids = {line: index for index, line in enumerate(self.lines)}
+		segment_line_sets = {}
+		for segment, lines in removed_lines.items():
+			station1, station2 = (self.station_ids[station] for station in segment)
+			index = self.edge_index(station1, station2)
+			remaining = self.line_sets[self._edge_line_sets[index]] \
+				- {line_ids[line] for line in lines}
+			line_set = self.line_set_id(remaining) if remaining else -1
+			segment_line_sets[index] = line_set
+			segment_line_sets[self.edge_index(station2, station1)] = line_set
+		
+		for segment in removed_segments:
+			station1, station2 = (self.station_ids[station] for station in segment)
+			segment_line_sets[self.edge_index(station1, station2)] = -1
+			segment_line_sets[self.edge_index(station2, station1)] = -1
+		
+		return {self.station_ids[station] for station in removed_stations}, segment_line_sets
+	
+	def search(self,
+		source: int,
+		target: int = -1,
+		removed_stations: set[int] = frozenset(),
+		segment_line_sets: dict[int, int] = None,
+		targets: set[int] = None
+	) -> tuple[dict[int, tuple[float, int]], dict[int, tuple[int, bool]]]:
+		"""
+		The same search as `TransitGraph.line_expanded_search` on station & group ids. A state
+		is encoded as a single integer `(group + 1) * station_count + station`, where the group
+		of the source state is -1.
+		:param source: The source station id
+		:param target: Optional target station id, which stops the search once it is reached.
+		:param removed_stations: Station ids to skip, see `self.overlay`
+		:param segment_line_sets: Line sets replacing those of disrupted segments, see
+			`self.overlay`
+		:param targets: Optional target station ids, which stop the search once all of them
+			are reached.
+		:return: A tuple of the following information:
+			(1) A dictionary of station id -> (time, state) for the best state at each station.
+			(2) The parent state of each state & whether it was reached by a transfer.
+		"""
+		offsets = self._offsets
+		neighbors = self._neighbors
+		travel_times = self._travel_times
+		edge_line_sets = self._edge_line_sets
+		line_set_groups = self.line_set_groups
+		group_types = self.group_types
+		group_waits = self.group_waits
+		intersections = self._intersections
+		station_count = len(self.stations)
+		
+		best_times = {source: 0.0}
+		parents = {source: None}
+		labels = {}
+		queue = [(0.0, source)]
+		remaining = None if targets is None else set(targets) - {source}
+		
+		while queue:
+			time, state = heappop(queue)
+			if time > best_times[state]:
+				continue
+			group = state // station_count - 1
+			station = state % station_count
+			if station not in labels:
+				labels[station] = (time, state)
+				if station == target:
+					break
+				if remaining is not None:
+					remaining.discard(station)
+					if not remaining:
+						break
+			
+			wait_current = 0 if group < 0 else group_waits[group]
+			for index in range(offsets[station], offsets[station + 1]):
+				neighbor = neighbors[index]
+				if neighbor in removed_stations:
+					continue
+				line_set = edge_line_sets[index]
+				if segment_line_sets is not None:
+					line_set = segment_line_sets.get(index, line_set)
+					if line_set < 0:
+						continue
+				
+				for next_group in line_set_groups[line_set]:
+					continued = -1
+					if group >= 0:
+						continued = intersections.get((group, next_group))
+						if continued is None:
+							continued = self._intersect(group, next_group)
+					
+					if continued >= 0:
+						next_time = time + travel_times[index] + group_waits[continued] - wait_current
+						next_state = (continued + 1) * station_count + neighbor
+						if next_time < best_times.get(next_state, float('inf')):
+							best_times[next_state] = next_time
+							parents[next_state] = (state, False)
+							heappush(queue, (next_time, next_state))
+					if continued != next_group:
+						# transfer onto the whole group, whose wait can undercut riding on
+						next_time = time + travel_times[index] + group_waits[next_group]
+						if group >= 0:
+							next_time += 1 if group_types[next_group] == group_types[group] else 2
+						next_state = (next_group + 1) * station_count + neighbor
+						if next_time < best_times.get(next_state, float('inf')):
+							best_times[next_state] = next_time
+							parents[next_state] = (state, True)
+							heappush(queue, (next_time, next_state))
+		
+		return labels, parents
+	
+	def route(self,
+		state: int,
+		parents: dict[int, tuple[int, bool]]
+	) -> tuple[list[set[str]], list[str]]:
+		"""
+		Reconstructs a journey found by `self.search`, in the format of
+		`TransitGraph.line_expanded_route`.
+		"""
+		station_count = len(self.stations)
+		stations = []
+		lines_used = []
+		leg_closed = True
+		while parents[state] is not None:
+			stations.append(self.stations[state % station_count])
+			# the group of a leg is narrowest at its last state
+			if leg_closed:
+				group = self.groups[state // station_count - 1]
+				lines_used.append({self.lines[line] for line in group})
+			state, leg_closed = parents[state]
+		stations.append(self.stations[state % station_count])
+		
+		stations.reverse()
+		lines_used.reverse()
+		return lines_used, stations
+	
+	def fastest_path(self,
+		source: str,
+		target: str,
+		removed_stations: set[int] = frozenset(),
+		segment_line_sets: dict[int, int] = None
+	) -> tuple[list[set[str]], float, list[str]]:
+		"""
+		Finds the fastest journey between 2 stations by name, in the format of
+		`TransitGraph.fastest_path`.
+		:raise nx.NodeNotFound: If the source or target is not in the graph or removed.
+		:raise nx.NetworkXNoPath: If the target is not reachable from the source.
+		"""
+		for station in [source, target]:
+			if station not in self.station_ids or self.station_ids[station] in removed_stations:
+				raise nx.NodeNotFound(f'Station {station} is not in the graph')
+		
+		labels, parents = self.search(
+			self.station_ids[source], self.station_ids[target], removed_stations, segment_line_sets
+		)
+		if self.station_ids[target] not in labels:
+			raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+		time, state = labels[self.station_ids[target]]
+		lines, stations = self.route(state, parents)
+		return lines, time, stations
@@ -1,64 +1,252 @@
 from difflib import SequenceMatcher
+from heapq import nlargest
+from re import sub
+from multiprocessing import Pool
 
 
 def detect_possible_duplicates(
-	station_names: list[str], threshold: float = .8
-) -> list[tuple[str, str]]:
+	station_names: list[str],
+	threshold: float = .8,
+	window: int = 5,
+	min_shared: float = .3,
+	max_block: int = 200,
+	workers: int = 1
+) -> list[dict]:
 	"""
 	Detects possible duplicates in station names based on string similarity and naming conventions.
+	Instead of comparing every pair of names, a blocking stage first collects candidate pairs,
+	see `duplicate_candidates`. Only these are compared with `SequenceMatcher`.
 	:param station_names: list of all station names
 	:param threshold: threshold for similarity, between 0 & 1
-	:return: list of tuples, each containing two station names considered potential duplicates.
+	:param window: see `duplicate_candidates()` for docs
+	:param min_shared: see `duplicate_candidates()` for docs
+	:param max_block: see `duplicate_candidates()` for docs
+	:param workers: # of processes to compare the candidates with. On platforms which spawn
+		instead of fork processes, the calling script needs an `if __name__ == '__main__':` guard.
+	:return: A list of dictionaries, sorted from highest to lowest score, of the following keys:
+	
+		* pair : A tuple of the 2 station names considered potential duplicates.
+		
+		* score : The `SequenceMatcher` similarity of both names.
+		
+		* reason : `containment` if one name contains the other, otherwise `similarity`.
 	"""
-	duplicates = []
-	for i in range(len(station_names)):
-		for j in range(i + 1, len(station_names)):
-			name1 = station_names[i]
-			name2 = station_names[j]
-			
-			# basic containment check (one name contains the other)
-			if name1 in name2 or name2 in name1:
-				duplicates.append((name1, name2))
-			
-			# string similarity check using SequenceMatcher
-			similarity = SequenceMatcher(None, name1, name2).ratio()
-			if similarity >= threshold:
-				duplicates.append((name1, name2))
+	pairs = [
+		(station_names[first], station_names[second])
+		for first, second in sorted(duplicate_candidates(station_names, window, min_shared, max_block))
+	]
+	
+	if workers > 1 and len(pairs) > 1:
+		chunk_size = -(-len(pairs) // (workers * 4))
+		with Pool(workers) as pool:
+			chunks = pool.starmap(
+				_compare_names,
+				[(pairs[index:index + chunk_size], threshold) for index in range(0, len(pairs), chunk_size)]
+			)
+		duplicates = [duplicate for chunk in chunks for duplicate in chunk]
+	else:
+		duplicates = _compare_names(pairs, threshold)
+	
+	return sorted(duplicates, key=lambda duplicate: -duplicate['score'])
+
+
+def duplicate_candidates(
+	station_names: list[str],
+	window: int = 5,
+	min_shared: float = .3,
+	max_block: int = 200
+) -> set[tuple[int, int]]:
+	"""
+	Blocking stage of `detect_possible_duplicates`. A pair of names becomes a candidate if
+	
+	* their normalized names share enough character n-grams, see `name_ngrams`, or
+	
+	* they are at most `window` apart when all normalized names are sorted.
 	
+	:param station_names: list of all station names
+	:param window: # of following names in sorted order each name is paired with
+	:param min_shared: Minimum fraction of the n-grams of the shorter name that both share
+	:param max_block: N-grams found in more names than this are ignored, since very common
+		parts such as `strasse` would otherwise pair almost every name.
+	:return: The indices of both names of each candidate pair, the smaller index first.
+	"""
+	normalized = [normalize_station_name(name) for name in station_names]
+	ngrams = [name_ngrams(name) for name in normalized]
+	
+	blocks: dict[str, list[int]] = {}
+	for index, name_grams in enumerate(ngrams):
+		for ngram in name_grams:
+			blocks.setdefault(ngram, []).append(index)
+	
+	shared: dict[tuple[int, int], int] = {}
+	for block in blocks.values():
+		if len(block) > max_block:
+			continue
+		for position, first in enumerate(block):
+			for second in block[position + 1:]:
+				shared[(first, second)] = shared.get((first, second), 0) + 1
+	
+	candidates = {
+		pair for pair, count in shared.items()
+		if count >= min_shared * max(1, min(len(ngrams[pair[0]]), len(ngrams[pair[1]])))
+	}
+	
+	# sorted neighborhood
+	order = sorted(range(len(station_names)), key=lambda index: normalized[index])
+	for position, first in enumerate(order):
+		for second in order[position + 1:position + 1 + window]:
+			candidates.add((min(first, second), max(first, second)))
+	
+	return candidates
+
+
+def _compare_names(pairs: list[tuple[str, str]], threshold: float) -> list[dict]:
+	"""
+	Compares candidate pairs for `detect_possible_duplicates`.
+	"""
+	duplicates = []
+	for name1, name2 in pairs:
+		similarity = SequenceMatcher(None, name1, name2).ratio()
+		# basic containment check (one name contains the other)
+		if name1 in name2 or name2 in name1:
+			duplicates.append({'pair': (name1, name2), 'score': similarity, 'reason': 'containment'})
+		# string similarity check using SequenceMatcher
+		elif similarity >= threshold:
+			duplicates.append({'pair': (name1, name2), 'score': similarity, 'reason': 'similarity'})
 	return duplicates
 
 
+'''
+Spelling variants replaced by `normalize_station_name`, in order. Umlauts are written out
+first, so `straße`, `strasse` & `str.` all end up as `strasse`.
+'''
+name_replacements = [
+	('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss'),
+	(r'(?<=\w)str\.', 'strasse'),
+	(r'\bstr\.', 'strasse'),
+	(r'(?<=\w)g\.', 'gasse'),
+	(r'(?<=\w)pl\.', 'platz'),
+	# split compounds such as `waehringerstrasse` into `waehringer strasse`
+	(r'(?<=\w)(strasse|gasse|platz|allee|guertel|bahnhof)\b', r' \1'),
+	# hyphens, slashes, commas & any other separators
+	(r'[^a-z0-9]+', ' '),
+]
+
+
+def normalize_station_name(name: str) -> str:
+	"""
+	Converts a station name into a lowercase form without umlauts, abbreviations or
+	separators, see `name_replacements`. Different spellings of the same station, such as
+	`Währingerstraße-Volksoper` & `Waehringer Str. Volksoper`, give the same result.
+	"""
+	name = name.lower()
+	for pattern, replacement in name_replacements:
+		name = sub(pattern, replacement, name)
+	return name.strip()
+
+
+def name_ngrams(name: str, n: int = 3) -> set[str]:
+	"""
+	The character n-grams of every word of a normalized name, padded with a space on both
+	sides so the start & end of words count.
+	"""
+	ngrams = set()
+	for word in name.split():
+		word = f' {word} '
+		ngrams.update(word[index:index + n] for index in range(len(word) - n + 1))
+	return ngrams
+
+
+class StationIndex:
+	def __init__(self, stations: list[str], n: int = 3):
+		"""
+		Character n-gram index over station names for fuzzy lookups. The names are normalized
+		by `normalize_station_name` & every n-gram points to the stations containing it, so a
+		lookup only scores the stations sharing at least 1 n-gram with the query.
+		:param stations: The station names to index
+		:param n: Length of the n-grams
+		"""
+		self.n = n
+		self.stations = list(stations)
+		self.normalized = [normalize_station_name(station) for station in self.stations]
+		self.ngram_counts: list[int] = []
+		self.postings: dict[str, list[int]] = {}
+		for index, name in enumerate(self.normalized):
+			ngrams = name_ngrams(name, n)
+			self.ngram_counts.append(len(ngrams))
+			for ngram in ngrams:
+				self.postings.setdefault(ngram, []).append(index)
+	
+	def top_k(
+		self,
+		query: str,
+		k: int = 10,
+		threshold: float = 0,
+		allowed: set[str] = None
+	) -> list[tuple[str, float]]:
+		"""
+		Finds the stations most similar to a query. The score is the mean of the Dice
+		coefficient of both sets of n-grams & the fraction of the query n-grams found in the
+		station. The latter keeps partial names, such as a single part of a compound name,
+		high in the results. An identical normalized name always scores 1.
+		:param query: The (partial) station name to look up
+		:param k: Maximum # of results
+		:param threshold: Minimum score of the results, between 0 & 1
+		:param allowed: Only consider these stations, all stations if left empty
+		:return: Up to `k` stations & their scores, from highest to lowest score.
+		"""
+		normalized = normalize_station_name(query)
+		ngrams = name_ngrams(normalized, self.n)
+		if not ngrams:
+			return []
+		
+		shared: dict[int, int] = {}
+		for ngram in ngrams:
+			for index in self.postings.get(ngram, ()):
+				shared[index] = shared.get(index, 0) + 1
+		
+		results = []
+		for index, count in shared.items():
+			if allowed is not None and self.stations[index] not in allowed:
+				continue
+			if self.normalized[index] == normalized:
+				score = 1.0
+			else:
+				dice = 2 * count / (len(ngrams) + self.ngram_counts[index])
+				score = (dice + count / len(ngrams)) / 2
+			if score >= threshold:
+				results.append((self.stations[index], score))
+		
+		return nlargest(k, results, key=lambda result: result[1])
+
+
 def find_possible_match(
 	input_station: str,
 	possible_stations: list[str],
 	max_results: int = 10,
-	threshold: float = .6
+	threshold: float = .4,
+	index: StationIndex = None
 ) -> None:
 	"""
-	Given an entire list of available stations, determine the most similar ones
+	Given an entire list of available stations, print the most similar ones
+	:param input_station: The station that was not found
+	:param possible_stations: The stations to suggest from
+	:param max_results: Maximum # of suggestions
+	:param threshold: Minimum score of a suggestion, see `StationIndex.top_k`
+	:param index: A prebuilt index containing at least `possible_stations`. If left empty,
+		an index is built for this call.
 	"""
 	print(f'input: {input_station}')
-	candidates = []
-	
-	input_station_lower = input_station.lower()
-	input_station_lower = input_station_lower\
-		.replace('str.', 'straße')\
-		.replace('g.', 'gasse')
-	
-	for station in possible_stations:
-		if input_station_lower in station.lower() or station.lower() in input_station_lower:
-			candidates.append(station)
-		
-		# TODO: find better matches for missing parts of names
-		
-		if SequenceMatcher(None, input_station_lower, station.lower()).ratio() >= threshold:
-			candidates.append(station)
+	if index is None:
+		candidates = StationIndex(possible_stations).top_k(input_station, max_results, threshold)
+	else:
+		candidates = index.top_k(input_station, max_results, threshold, set(possible_stations))
 
 	print(f'Station {input_station} not found')
 	
 	if len(candidates) > 0:
 		print('Did you mean:')
-		for candidate in candidates[:max_results]:
+		for candidate, _ in candidates:
 			print(f'\t{candidate}')
 		print('Try again with an exact name.')
 	else:
@@ -71,13 +259,13 @@ Examples:
 station_names = [
 	"Westbahnhof", "Westbahnhof S", "Karlsplatz", "Oper, Karlsplatz", "Bahnhof", "Hauptbahnhof"
 ]
-duplicates = detect_possible_duplicates(station_names)
-print(duplicates)
+for duplicate in detect_possible_duplicates(station_names):
+	print(duplicate['pair'], duplicate['score'], duplicate['reason'])
 
 or
 
 form TransitGraph import TransitGraph as TG
 net = TG()
-for pair in detect_possible_duplicates(list(net.nodes)):
-	print(pair)
+for duplicate in detect_possible_duplicates(list(net.nodes)):
+	print(duplicate)
 '''
\ No newline at end of file
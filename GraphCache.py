@@ -0,0 +1,120 @@
+import numpy as np
+import networkx as nx
+from os import replace, getpid
+from os.path import normpath
+from BinaryStore import write_store, read_store
+
+'''
+Increased whenever the layout of the graph cache changes, so older files are rejected.
+'''
+FORMAT_VERSION = 2
+
+'''
+The cache of a line folder is kept next to the folder, so every folder has a cache of its own.
+`{line_folder}` is replaced by the folder, see `cache_path`.
+'''
+DEFAULT_PATH = '{line_folder}.graph_cache.bin'
+
+
+def cache_path(path: str, line_folder: str) -> str:
+	"""
+	The path of the cache of a line folder, such as `lines.graph_cache.bin` for `DEFAULT_PATH`
+	& the folder `lines`.
+	:param path: A path, where `{line_folder}` is replaced by the folder
+	:param line_folder: The folder of line files the cache is built from
+	"""
+	return path.replace('{line_folder}', normpath(line_folder))
+
+
+def write_graph_cache(net, path: str = DEFAULT_PATH) -> None:
+	"""
+	Compiles a loaded `TransitGraph` into a binary file, which `read_graph_cache` can load
+	with a single read instead of parsing every line file. The file is keyed by
+	`TransitGraph.network_hash`, so it is rejected once any line file changes. The order of
+	the stations & of the neighbors of each station is kept, since the `heuristic` routing
+	breaks ties between paths by it. The stations of every line are stored in order as well,
+	which the `raptor` routing scans.
+	:param net: An undisrupted `TransitGraph` loaded from its line folder
+	:param path: The file to write, see `cache_path`. It is first written under a temporary
+		name & then moved into place, so processes starting at the same time never read a
+		partial file.
+	"""
+	path = cache_path(path, net.line_folder)
+	stations = list(net.nodes)
+	station_ids = {station: index for index, station in enumerate(stations)}
+	registry = net.line_registry
+	types = sorted(set(registry.types))
+	
+	edges = _edge_order(net)
+	line_offsets = [0]
+	line_ids = []
+	for station1, station2 in edges:
+		line_ids.extend(registry.line_ids(net[station1][station2]['line_mask']))
+		line_offsets.append(len(line_ids))
+	
+	station_offsets = [0]
+	line_stations = []
+	for line_name in registry.names:
+		line_stations.extend(station_ids[station] for station in net.line_stations[line_name])
+		station_offsets.append(len(line_stations))
+	
+	temporary_path = f'{path}.{getpid()}.tmp'
+	write_store(
+		temporary_path,
+		header={
+			'format': 'graph_cache',
+			'version': FORMAT_VERSION,
+			'network_hash': net.network_hash,
+			'stations': stations,
+			'lines': registry.names,
+			'line_types': registry.types,
+			'types': types,
+		},
+		arrays={
+			'edge_sources': np.array([station_ids[edge[0]] for edge in edges], dtype=np.int32),
+			'edge_targets': np.array([station_ids[edge[1]] for edge in edges], dtype=np.int32),
+			'edge_types': np.array(
+				[types.index(net[station1][station2]['type']) for station1, station2 in edges],
+				dtype=np.int8
+			),
+			'edge_line_offsets': np.array(line_offsets, dtype=np.int32),
+			'edge_line_ids': np.array(line_ids, dtype=np.int32),
+			'line_station_offsets': np.array(station_offsets, dtype=np.int32),
+			'line_station_ids': np.array(line_stations, dtype=np.int32),
+		}
+	)
+	replace(temporary_path, path)
+
+
+def read_graph_cache(path: str, network_hash: str = None) -> tuple[dict, dict]:
+	"""
+	Reads a file written by `write_graph_cache` with a single bulk read.
+	:param path: The file to read, see `cache_path`
+	:param network_hash: The `TransitGraph.network_hash` the cache must have been built for.
+		Left empty, the cache is not checked.
+	:return: The header & the arrays by name, see `TransitGraph.load_graph_cache`.
+	:raise OSError: If the file cannot be read.
+	:raise ValueError: If the file is not a graph cache of this version or network.
+	"""
+	header, arrays = read_store(path, memory_map=False)
+	if header.get('format') != 'graph_cache' or header.get('version') != FORMAT_VERSION:
+		raise ValueError(f'{path} is not a graph cache of version {FORMAT_VERSION}')
+	if network_hash is not None and header['network_hash'] != network_hash:
+		raise ValueError(f'Graph cache {path} is stale, the line files have changed since it was built.')
+	return header, arrays
+
+
+def _edge_order(net: nx.Graph) -> list[tuple[str, str]]:
+	"""
+	An order of all edges in which adding them rebuilds the neighbors of every station in the
+	same order. Each station requires its edges in the order of its neighbors, so any
+	topological order of these requirements works. The order the edges were originally added
+	in is one of them, so it always exists.
+	"""
+	edges = {frozenset(edge): edge for edge in net.edges}
+	requirements = nx.DiGraph()
+	requirements.add_nodes_from(edges.values())
+	for station in net.nodes:
+		incident = [edges[frozenset([station, neighbor])] for neighbor in net.adj[station]]
+		requirements.add_edges_from(zip(incident, incident[1:]))
+	return list(nx.topological_sort(requirements))
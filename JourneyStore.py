@@ -0,0 +1,229 @@
+import numpy as np
+from array import array
+
+'''
+Status of the result of a journey after a disruption.
+'''
+PENDING = 0  # not simulated yet
+ROUTED = 1  # `time_new` holds the new journey time
+CANCELED = 2  # no longer possible due to the disruption
+
+
+class JourneyStore:
+	def __init__(self, capacity: int = 1_024):
+		"""
+		Columnar storage of simulated journeys, used as `Simulator.journeys`. Station names &
+		sets of lines are interned to integer ids, times are kept in float arrays & the station
+		paths & lines of all journeys are concatenated into ragged arrays, which are sliced by
+		offset arrays. Indexing or iterating the store still gives each journey as a dictionary
+		of the following keys, in the format of `TransitGraph.fastest_path`:
+		
+		* origin, target, lines, time, stations : The undisrupted journey.
+		
+		*
+			lines_new, time_new, stations_new : The journey after a disruption. These are only
+			present once the journey has been routed with the disruption & is still possible.
+		
+		:param capacity: The initial # of journeys to reserve space for. The columns double
+			in size whenever they are full.
+		"""
+		self.stations: list[str] = []
+		self.station_ids: dict[str, int] = {}
+		self.line_sets: list[frozenset[str]] = []
+		self.line_set_ids: dict[frozenset[str], int] = {}
+		
+		self.count = 0
+		self._origins = np.zeros(capacity, dtype=np.int32)
+		self._targets = np.zeros(capacity, dtype=np.int32)
+		self._times = np.zeros(capacity, dtype=np.float64)
+		self._path_offsets = np.zeros(capacity + 1, dtype=np.int64)
+		self._leg_offsets = np.zeros(capacity + 1, dtype=np.int64)
+		self.path_data = array('i')
+		self.leg_data = array('i')
+		
+		# results of the current disruption
+		self._times_new = np.full(capacity, np.nan)
+		self._status = np.zeros(capacity, dtype=np.int8)
+		# index of the new route of each journey, or -1 if it kept its undisrupted route
+		self._new_routes = np.full(capacity, -1, dtype=np.int32)
+		self.new_path_offsets = array('q', [0])
+		self.new_path_data = array('i')
+		self.new_leg_offsets = array('q', [0])
+		self.new_leg_data = array('i')
+	
+	@property
+	def origins(self) -> np.ndarray:
+		return self._origins[:self.count]
+	
+	@property
+	def targets(self) -> np.ndarray:
+		return self._targets[:self.count]
+	
+	@property
+	def times(self) -> np.ndarray:
+		return self._times[:self.count]
+	
+	@property
+	def times_new(self) -> np.ndarray:
+		return self._times_new[:self.count]
+	
+	@property
+	def status(self) -> np.ndarray:
+		return self._status[:self.count]
+	
+	@property
+	def path_offsets(self) -> np.ndarray:
+		return self._path_offsets[:self.count + 1]
+	
+	def __len__(self) -> int:
+		return self.count
+	
+	def __getitem__(self, index: int) -> dict:
+		if not -self.count <= index < self.count:
+			raise IndexError('journey index out of range')
+		index %= self.count
+		
+		journey = {
+			'origin': self.stations[self._origins[index]],
+			'target': self.stations[self._targets[index]],
+			'lines': self.lines_of(index),
+			'time': float(self._times[index]),
+			'stations': self.stations_of(index)
+		}
+		if self._status[index] == ROUTED:
+			journey['lines_new'] = self.lines_of(index, new=True)
+			journey['time_new'] = float(self._times_new[index])
+			journey['stations_new'] = self.stations_of(index, new=True)
+		return journey
+	
+	def __iter__(self):
+		for index in range(self.count):
+			yield self[index]
+	
+	def station_id(self, station: str) -> int:
+		"""
+		The interned id of a station, registering it if it is new.
+		"""
+		if station not in self.station_ids:
+			self.station_ids[station] = len(self.stations)
+			self.stations.append(station)
+		return self.station_ids[station]
+	
+	def line_set_id(self, lines: set[str]) -> int:
+		"""
+		The interned id of a set of lines, registering it if it is new.
+		"""
+		lines = frozenset(lines)
+		if lines not in self.line_set_ids:
+			self.line_set_ids[lines] = len(self.line_sets)
+			self.line_sets.append(lines)
+		return self.line_set_ids[lines]
+	
+	def append(self,
+		origin: str,
+		target: str,
+		lines: list[set[str]],
+		time: float,
+		stations: list[str]
+	) -> int:
+		"""
+		Adds an undisrupted journey.
+		:return: The index of the journey.
+		"""
+		if self.count == len(self._times):
+			self._grow()
+		index = self.count
+		
+		self._origins[index] = self.station_id(origin)
+		self._targets[index] = self.station_id(target)
+		self._times[index] = time
+		self.path_data.extend(self.station_id(station) for station in stations)
+		self.leg_data.extend(self.line_set_id(leg) for leg in lines)
+		self._path_offsets[index + 1] = len(self.path_data)
+		self._leg_offsets[index + 1] = len(self.leg_data)
+		
+		self.count += 1
+		return index
+	
+	def _grow(self) -> None:
+		"""
+		Doubles the capacity of all per journey columns.
+		"""
+		capacity = len(self._times)
+		for name, fill in [
+			('_origins', 0), ('_targets', 0), ('_times', 0), ('_times_new', np.nan),
+			('_status', 0), ('_new_routes', -1), ('_path_offsets', 0), ('_leg_offsets', 0)
+		]:
+			column = getattr(self, name)
+			grown = np.full(len(column) + capacity, fill, dtype=column.dtype)
+			grown[:len(column)] = column
+			setattr(self, name, grown)
+	
+	def station_ids_of(self, index: int, new: bool = False) -> array:
+		"""
+		The station ids visited by a journey, after the disruption if `new` is set.
+		"""
+		if new and self._new_routes[index] >= 0:
+			route = self._new_routes[index]
+			return self.new_path_data[self.new_path_offsets[route]:self.new_path_offsets[route + 1]]
+		return self.path_data[self._path_offsets[index]:self._path_offsets[index + 1]]
+	
+	def stations_of(self, index: int, new: bool = False) -> list[str]:
+		"""
+		The stations visited by a journey, after the disruption if `new` is set.
+		"""
+		return [self.stations[station] for station in self.station_ids_of(index, new)]
+	
+	def lines_of(self, index: int, new: bool = False) -> list[set[str]]:
+		"""
+		The lines used by a journey, after the disruption if `new` is set.
+		"""
+		if new and self._new_routes[index] >= 0:
+			route = self._new_routes[index]
+			legs = self.new_leg_data[self.new_leg_offsets[route]:self.new_leg_offsets[route + 1]]
+		else:
+			legs = self.leg_data[self._leg_offsets[index]:self._leg_offsets[index + 1]]
+		return [set(self.line_sets[leg]) for leg in legs]
+	
+	def keep_undisrupted(self, indices: np.ndarray | list[int] = None) -> None:
+		"""
+		Marks journeys as routed with their undisrupted result.
+		:param indices: The journeys to mark, all journeys if left empty.
+		"""
+		if indices is None:
+			indices = slice(0, self.count)
+		self._times_new[indices] = self._times[indices]
+		self._status[indices] = ROUTED
+		self._new_routes[indices] = -1
+	
+	def set_new(self, index: int, lines: list[set[str]], time: float, stations: list[str]) -> None:
+		"""
+		Stores the result of a journey after a disruption.
+		"""
+		self._times_new[index] = time
+		self._status[index] = ROUTED
+		self._new_routes[index] = len(self.new_path_offsets) - 1
+		self.new_path_data.extend(self.station_id(station) for station in stations)
+		self.new_leg_data.extend(self.line_set_id(leg) for leg in lines)
+		self.new_path_offsets.append(len(self.new_path_data))
+		self.new_leg_offsets.append(len(self.new_leg_data))
+	
+	def cancel(self, index: int) -> None:
+		"""
+		Marks a journey as no longer possible after a disruption.
+		"""
+		self._times_new[index] = np.nan
+		self._status[index] = CANCELED
+		self._new_routes[index] = -1
+	
+	def clear_new(self) -> None:
+		"""
+		Removes all results of a disruption.
+		"""
+		self._times_new[:] = np.nan
+		self._status[:] = PENDING
+		self._new_routes[:] = -1
+		self.new_path_offsets = array('q', [0])
+		self.new_path_data = array('i')
+		self.new_leg_offsets = array('q', [0])
+		self.new_leg_data = array('i')
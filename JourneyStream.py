@@ -0,0 +1,120 @@
+import json
+import numpy as np
+from os import fsync
+from typing import Iterator
+from JourneyStore import PENDING, ROUTED
+
+'''
+Increased whenever the layout of the records changes, so older files are not resumed.
+'''
+FORMAT_VERSION = 1
+
+
+def open_stream(path: str, header: dict, resume: bool = True) -> tuple:
+	"""
+	Opens a JSON lines file of simulated journeys for appending, see `Simulator.stream_journeys`.
+	The first line holds the header, every further line a single journey. A line cut off by
+	a crash is removed, so only complete journeys are ever resumed.
+	:param path: The file to write
+	:param header: Describes the run, such as the network, seed & disruptions. Resuming
+		requires the same header, since the journeys would otherwise not be comparable.
+	:param resume: Keep the journeys of an existing file. Otherwise the file is overwritten.
+	:return: The file opened for appending & the # of journeys it already holds.
+	:raise ValueError: If the existing file belongs to a different run.
+	"""
+	header = {'format': 'journey_stream', 'version': FORMAT_VERSION, **header}
+	try:
+		file = open(path, 'r+b' if resume else 'w+b')
+	except FileNotFoundError:
+		file = open(path, 'w+b')
+	
+	# the end of the last complete line
+	complete = 0
+	count = -1
+	for line in file:
+		if not line.endswith(b'\n'):
+			break
+		if count < 0 and json.loads(line) != header:
+			file.close()
+			raise ValueError(f'{path} holds journeys of a different run, set `resume` to False to overwrite it')
+		complete += len(line)
+		count += 1
+	
+	file.seek(complete)
+	file.truncate()
+	if count < 0:
+		file.write(json.dumps(header).encode() + b'\n')
+		count = 0
+	return file, count
+
+
+def append_journeys(file, journeys: list[dict]) -> None:
+	"""
+	Appends a batch of journeys & forces them onto the disk, so a crash afterwards keeps them.
+	:param file: A file returned by `open_stream`
+	:param journeys: Records in the format of `journey_record`
+	"""
+	file.write(b''.join(json.dumps(journey).encode() + b'\n' for journey in journeys))
+	file.flush()
+	fsync(file.fileno())
+
+
+def journey_record(
+	origin: str,
+	target: str,
+	result: tuple,
+	result_new: tuple | None = None,
+	status: int = PENDING
+) -> dict:
+	"""
+	A single journey as a record of the stream. The lines of every leg are stored as sorted
+	lists, since sets are not JSON serializable.
+	:param origin: The origin station
+	:param target: The target station
+	:param result: The undisrupted journey, in the format of `TransitGraph.fastest_path`
+	:param result_new: The journey after the disruption, if it was routed & is still possible
+	:param status: The status after the disruption, see `JourneyStore`
+	"""
+	lines, time, stations = result
+	record = {
+		'origin': origin,
+		'target': target,
+		'time': time,
+		'lines': [sorted(leg) for leg in lines],
+		'stations': stations,
+		'status': status,
+	}
+	if status == ROUTED:
+		lines_new, time_new, stations_new = result_new
+		record['time_new'] = time_new
+		record['lines_new'] = [sorted(leg) for leg in lines_new]
+		record['stations_new'] = stations_new
+	return record
+
+
+def read_journeys(path: str) -> Iterator[dict]:
+	"""
+	Reads the journeys of a stream one at a time, skipping the header & a line cut off by a
+	crash.
+	"""
+	with open(path, 'rb') as file:
+		file.readline()
+		for line in file:
+			if line.endswith(b'\n'):
+				yield json.loads(line)
+
+
+def read_columns(path: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+	"""
+	The columns of a stream needed by `Simulator.get_stream_stats`, without keeping the routes
+	in memory.
+	:return: The undisrupted times, the times after the disruption & the status of each journey.
+	"""
+	times = []
+	times_new = []
+	status = []
+	for journey in read_journeys(path):
+		times.append(journey['time'])
+		times_new.append(journey.get('time_new', np.nan))
+		status.append(journey['status'])
+	return np.array(times), np.array(times_new), np.array(status, dtype=np.int8)
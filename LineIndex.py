@@ -0,0 +1,59 @@
+class LineIndex:
+	def __init__(self, line_stations: dict[str, list[str]]):
+		"""
+		The order of the stations on every line, which the edges of a `TransitGraph` do not
+		keep, since they only hold a set of lines. Every station maps to its position on each
+		line serving it, so the stretch of a line between 2 stations is found in the time of
+		its length. Lines are assumed to pass each station once, as in the line files.
+		:param line_stations: The stations of each line in order, see `TransitGraph.line_stations`
+		"""
+		self.line_stations = line_stations
+		# station -> line name -> position of the station on the line
+		self.positions: dict[str, dict[str, int]] = {}
+		for line_name, stations in line_stations.items():
+			for position, station in enumerate(stations):
+				self.positions.setdefault(station, {}).setdefault(line_name, position)
+	
+	def lines_at(self, station: str) -> set[str]:
+		"""
+		All lines serving a station.
+		"""
+		return set(self.positions.get(station, {}))
+	
+	def lines_between(self, station1: str, station2: str) -> list[str]:
+		"""
+		The lines serving both stations, which therefore connect them without a transfer.
+		Disruptions are not considered here, see `TransitGraph.lines_between`.
+		:return: The sorted line names, empty if both stations are the same.
+		"""
+		positions1 = self.positions.get(station1, {})
+		positions2 = self.positions.get(station2, {})
+		if station1 == station2:
+			return []
+		if len(positions1) > len(positions2):
+			positions1, positions2 = positions2, positions1
+		return sorted(line_name for line_name in positions1 if line_name in positions2)
+	
+	def stretch(self, line_name: str, station1: str, station2: str) -> list[str]:
+		"""
+		The stations of a line from one station to another, both included.
+		:return: The stations in the order of travel from `station1` to `station2`.
+		:raise ValueError: If the line does not serve both stations.
+		"""
+		try:
+			start = self.positions[station1][line_name]
+			end = self.positions[station2][line_name]
+		except KeyError:
+			raise ValueError(f'Line {line_name} does not serve both {station1} & {station2}')
+		
+		stations = self.line_stations[line_name]
+		if start <= end:
+			return stations[start:end + 1]
+		return stations[end:start + 1][::-1]
+	
+	def segments(self, line_name: str, station1: str, station2: str) -> list[frozenset]:
+		"""
+		The segments of a line from one station to another, see `self.stretch`.
+		"""
+		stretch = self.stretch(line_name, station1, station2)
+		return [frozenset(segment) for segment in zip(stretch, stretch[1:])]
@@ -0,0 +1,100 @@
+from Metrics import Metrics
+
+
+class LineRegistry:
+	def __init__(self, metrics: Metrics = None):
+		"""
+		Integer ids of the lines of a `TransitGraph`, assigned in the order the lines are
+		loaded. A set of lines is stored as a bitmask with bit `id` set for every line it
+		contains, so that sets can be compared & intersected with integer operations. The type
+		& interval of each line are looked up once when it is registered, while the values
+		derived from a bitmask are memoized per bitmask.
+		:param metrics: Records the hit rates of the memoized values, usually the metrics of the
+			`TransitGraph`
+		"""
+		self.metrics = Metrics() if metrics is None else metrics
+		self.names: list[str] = []
+		self.ids: dict[str, int] = {}
+		self.types: list[str] = []
+		# trains per hour of each line
+		self.frequencies: list[float] = []
+		
+		self._line_sets: dict[int, frozenset[str]] = {}
+		self._first_types: dict[int, str] = {}
+		self._wait_times: dict[int, float] = {}
+	
+	def __len__(self) -> int:
+		return len(self.names)
+	
+	def add(self, line: str, line_type: str, interval: float) -> int:
+		"""
+		Registers a line, replacing the type & interval of an already registered line.
+		:param line: The name of the line
+		:param line_type: The type of the line, see `TransitGraph.detect_line_type`
+		:param interval: The # of minutes between 2 trains of the line
+		:return: The id of the line.
+		"""
+		if line in self.ids:
+			line_id = self.ids[line]
+			self.types[line_id] = line_type
+			self.frequencies[line_id] = 60 / interval
+			self._first_types.clear()
+			self._wait_times.clear()
+			return line_id
+		
+		self.ids[line] = len(self.names)
+		self.names.append(line)
+		self.types.append(line_type)
+		self.frequencies.append(60 / interval)
+		return self.ids[line]
+	
+	def mask(self, lines: set[str]) -> int:
+		"""
+		The bitmask of a set of registered lines.
+		:raise KeyError: If any of the lines is not registered.
+		"""
+		mask = 0
+		for line in lines:
+			mask |= 1 << self.ids[line]
+		return mask
+	
+	def line_ids(self, mask: int) -> list[int]:
+		"""
+		The ids of the lines in a bitmask, in ascending order.
+		"""
+		ids = []
+		while mask:
+			lowest = mask & -mask
+			ids.append(lowest.bit_length() - 1)
+			mask ^= lowest
+		return ids
+	
+	def lines(self, mask: int) -> frozenset[str]:
+		"""
+		The names of the lines in a bitmask.
+		"""
+		if mask not in self._line_sets:
+			self._line_sets[mask] = frozenset(self.names[line_id] for line_id in self.line_ids(mask))
+		return self._line_sets[mask]
+	
+	def first_type(self, mask: int) -> str:
+		"""
+		The type of the first loaded line in a bitmask, used as the type of the whole set by
+		`TransitGraph.fastest_paths`.
+		"""
+		if self.metrics.enabled:
+			self.metrics.cache_access('line_types', mask in self._first_types)
+		if mask not in self._first_types:
+			self._first_types[mask] = self.types[(mask & -mask).bit_length() - 1]
+		return self._first_types[mask]
+	
+	def wait_time(self, mask: int) -> float:
+		"""
+		The average wait time for any line in a bitmask, see `TransitGraph.segment_wait_time`.
+		"""
+		if self.metrics.enabled:
+			self.metrics.cache_access('wait_times', mask in self._wait_times)
+		if mask not in self._wait_times:
+			trains_per_hour = sum(self.frequencies[line_id] for line_id in self.line_ids(mask))
+			self._wait_times[mask] = 30 / trains_per_hour
+		return self._wait_times[mask]
@@ -0,0 +1,85 @@
+from time import perf_counter
+from typing import Callable
+
+
+class Metrics:
+	def __init__(self, enabled: bool = False, trace: Callable[[dict], None] = None):
+		"""
+		Counters, timers & cache hit rates collected by `TransitGraph` & `Simulator`. All
+		instrumented code checks `self.enabled` first, so collection costs a single attribute
+		lookup while disabled.
+		:param enabled: Whether to collect anything
+		:param trace: Called with a dictionary describing every routed query, see
+			`TransitGraph.fastest_path`. Only called while enabled.
+		"""
+		self.enabled = enabled
+		self.trace = trace
+		self.counters: dict[str, int] = {}
+		self.timers: dict[str, float] = {}
+		self.timer_counts: dict[str, int] = {}
+		# hits & misses of each cache
+		self.caches: dict[str, list[int]] = {}
+	
+	def count(self, name: str, amount: int = 1) -> None:
+		"""
+		Increases a counter.
+		"""
+		self.counters[name] = self.counters.get(name, 0) + amount
+	
+	def add_time(self, name: str, seconds: float) -> None:
+		"""
+		Adds a measured duration to a timer.
+		"""
+		self.timers[name] = self.timers.get(name, 0) + seconds
+		self.timer_counts[name] = self.timer_counts.get(name, 0) + 1
+	
+	def since(self, name: str, start: float) -> float:
+		"""
+		Adds the time since a `perf_counter()` value to a timer.
+		:return: The current `perf_counter()` value, to start timing the next phase with.
+		"""
+		now = perf_counter()
+		self.add_time(name, now - start)
+		return now
+	
+	def cache_access(self, name: str, hit: bool) -> None:
+		"""
+		Records a lookup in a cache.
+		"""
+		accesses = self.caches.setdefault(name, [0, 0])
+		accesses[0 if hit else 1] += 1
+	
+	def reset(self) -> None:
+		"""
+		Removes all collected values, keeping the settings.
+		"""
+		self.counters.clear()
+		self.timers.clear()
+		self.timer_counts.clear()
+		self.caches.clear()
+	
+	def snapshot(self) -> dict:
+		"""
+		The collected values as a dictionary of the following keys:
+		
+		* counters : The value of each counter.
+		
+		* timers : The total seconds, # of measurements & mean milliseconds of each timer.
+		
+		* caches : The hits, misses & hit rate of each cache.
+		"""
+		return {
+			'counters': dict(self.counters),
+			'timers': {
+				name: {
+					'seconds': seconds,
+					'count': self.timer_counts[name],
+					'mean_ms': seconds * 1000 / self.timer_counts[name],
+				}
+				for name, seconds in self.timers.items()
+			},
+			'caches': {
+				name: {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+				for name, (hits, misses) in self.caches.items()
+			},
+		}
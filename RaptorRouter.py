@@ -0,0 +1,294 @@
+import networkx as nx
+
+
+class RaptorRouter:
+	def __init__(self, net):
+		"""
+		Round based router over the lines of a `TransitGraph`, in the style of RAPTOR. Instead
+		of searching station by station with a priority queue, every round scans the lines
+		reachable from the stations improved in the previous round, in the order of their
+		stations. Round k therefore finds the fastest journeys with exactly k - 1 transfers,
+		which makes the fastest journey for every allowed # of transfers a by-product.
+		
+		The costs are the same as in `TransitGraph.line_expanded_search`: a leg pays the travel
+		time of its segments & the wait time of the lines of its type serving all of them, &
+		every transfer adds 1 minute, or 2 minutes onto a different type of line. Since the
+		transfer depends on the type of the previous leg, every station is labelled once per
+		type of line it was reached with.
+		
+		Each line is scanned in both directions as a pattern of station ids. Disruptions of the
+		`TransitGraph` are passed to `self.search` as an overlay, see `self.overlay`.
+		:param net: The transit graph to route on. The stations of each line are taken from
+			`TransitGraph.line_stations`.
+		"""
+		registry = net.line_registry
+		self.registry = registry
+		self.stations = list(net.nodes)
+		self.station_ids = {station: index for index, station in enumerate(self.stations)}
+		
+		# all lines of each type, since a leg only continues on lines of the same type
+		type_masks: dict[str, int] = {}
+		for line_id, line_type in enumerate(registry.types):
+			type_masks[line_type] = type_masks.get(line_type, 0) | 1 << line_id
+		
+		self.pattern_lines: list[int] = []
+		self.pattern_types: list[str] = []
+		self.pattern_stops: list[list[int]] = []
+		# travel time & mask of the lines of the same type of the segment after each stop
+		self.pattern_travel_times: list[list[float]] = []
+		self.pattern_masks: list[list[int]] = []
+		# (pattern, position) of every stop of each station
+		self.station_patterns: list[list[tuple[int, int]]] = [[] for _ in self.stations]
+		# (pattern, position) of every segment, used to translate disruptions
+		self.segment_positions: dict[frozenset[int], list[tuple[int, int]]] = {}
+		
+		for line_name, line_stations in net.line_stations.items():
+			line_id = registry.ids[line_name]
+			line_type = registry.types[line_id]
+			for direction in [line_stations, line_stations[::-1]]:
+				pattern = len(self.pattern_stops)
+				stops = [self.station_ids[station] for station in direction]
+				self.pattern_lines.append(line_id)
+				self.pattern_types.append(line_type)
+				self.pattern_stops.append(stops)
+				self.pattern_travel_times.append([
+					net[station1][station2]['travel_time']
+					for station1, station2 in zip(direction, direction[1:])
+				])
+				self.pattern_masks.append([
+					net[station1][station2]['line_mask'] & type_masks[line_type]
+					for station1, station2 in zip(direction, direction[1:])
+				])
+				for position, stop in enumerate(stops):
+					self.station_patterns[stop].append((pattern, position))
+					if position < len(stops) - 1:
+						self.segment_positions.setdefault(
+							frozenset([stop, stops[position + 1]]), []
+						).append((pattern, position))
+		
+		# wait time of each mask of lines, see `LineRegistry.wait_time`
+		self._wait_times: dict[int, float] = {}
+	
+	def overlay(self, net) -> tuple[set[int], dict[tuple[int, int], int]]:
+		"""
+		Translates the disruption overlay of a `TransitGraph` for `self.search`.
+		:return: The removed station ids & the remaining mask of every disrupted segment by
+			(pattern, position), where 0 marks a removed segment.
+		"""
+		removed_stations = {self.station_ids[station] for station in net.removed_stations}
+		segment_masks = {}
+		for segment in net.removed_segments | set(net.removed_lines):
+			station1, station2 = segment
+			remaining = net.segment_mask(station1, station2)
+			for pattern, position in self.segment_positions.get(
+				frozenset(self.station_ids[station] for station in segment), []
+			):
+				segment_masks[(pattern, position)] = self.pattern_masks[pattern][position] & remaining
+		return removed_stations, segment_masks
+	
+	def search(self,
+		source: int,
+		target: int = -1,
+		max_transfers: int = None,
+		removed_stations: set[int] = frozenset(),
+		segment_masks: dict[tuple[int, int], int] = None
+	) -> list[dict[tuple[int, str], tuple[float, tuple]]]:
+		"""
+		Runs rounds until no station improves or `max_transfers` is reached.
+		:param source: The source station id
+		:param target: Optional target station id. Stations reached later than the target are
+			then no longer improved, since they cannot lead to a faster journey.
+		:param max_transfers: The maximum # of transfers, unlimited if left empty.
+		:param removed_stations: Station ids to skip, see `self.overlay`
+		:param segment_masks: Masks replacing those of disrupted segments, see `self.overlay`
+		:return: The labels of every round, where round k holds the stations reached faster with
+			k - 1 transfers than with fewer, keyed by (station id, type of the last leg). Each
+			label is the time & the leg (pattern, boarding position, alighting position, mask,
+			label boarded from), see `self.route`. Round 0 only holds the source.
+		"""
+		wait_times = self._wait_times
+		pattern_lines = self.pattern_lines
+		pattern_types = self.pattern_types
+		pattern_stops = self.pattern_stops
+		pattern_travel_times = self.pattern_travel_times
+		pattern_masks = self.pattern_masks
+		station_patterns = self.station_patterns
+		infinity = float('inf')
+		
+		rounds = [{(source, None): (0.0, None)}]
+		# the best time of every label & of every station over all rounds so far
+		best_times = {(source, None): 0.0}
+		station_times = [infinity] * len(self.stations)
+		station_times[source] = 0.0
+		target_time = infinity
+		
+		while rounds[-1] and (max_transfers is None or len(rounds) <= max_transfers + 1):
+			labels = {}
+			
+			# the stations reached in the previous round, with their time by type of last leg
+			arrivals: dict[int, list[tuple[float, str, tuple]]] = {}
+			for key, (time, _) in rounds[-1].items():
+				arrivals.setdefault(key[0], []).append((time, key[1], key))
+			# each pattern is scanned from its first stop reached in the previous round
+			first_positions: dict[int, int] = {}
+			last_positions: dict[int, int] = {}
+			for station in arrivals:
+				for pattern, position in station_patterns[station]:
+					if position < first_positions.get(pattern, infinity):
+						first_positions[pattern] = position
+					if position > last_positions.get(pattern, -1):
+						last_positions[pattern] = position
+			
+			for pattern, first_position in first_positions.items():
+				line_bit = 1 << pattern_lines[pattern]
+				line_type = pattern_types[pattern]
+				stops = pattern_stops[pattern]
+				travel_times = pattern_travel_times[pattern]
+				masks = pattern_masks[pattern]
+				last_position = last_positions[pattern]
+				# mask of the lines ridden since boarding -> (time without the wait, boarding)
+				riding: dict[int, tuple[float, tuple]] = {}
+				
+				for position in range(first_position, len(stops)):
+					stop = stops[position]
+					if stop in removed_stations:
+						riding.clear()
+						continue
+					
+					if riding:
+						arrival = infinity
+						for mask, (time, boarding) in riding.items():
+							wait_time = wait_times.get(mask)
+							if wait_time is None:
+								wait_time = wait_times[mask] = self.registry.wait_time(mask)
+							if time + wait_time < arrival:
+								arrival = time + wait_time
+								leg = (pattern, boarding[0], position, mask, boarding[1])
+						key = (stop, line_type)
+						# a transfer from any other line type costs at most 1 minute more, so the
+						# label also has to beat the fastest label of the station by that much
+						if arrival < best_times.get(key, infinity) and arrival < station_times[stop] + 1 \
+							and arrival < target_time:
+							best_times[key] = arrival
+							labels[key] = (arrival, leg)
+							if arrival < station_times[stop]:
+								station_times[stop] = arrival
+							if stop == target:
+								target_time = arrival
+					elif position > last_position:
+						# nothing left to board
+						break
+					
+					if position == len(stops) - 1:
+						break
+					
+					if stop in arrivals:
+						# board with the cheapest transfer from any line type reaching the stop
+						boarding_time = infinity
+						for time, arrival_type, key in arrivals[stop]:
+							if arrival_type is not None:
+								time += 1 if arrival_type == line_type else 2
+							if time < boarding_time:
+								boarding_time = time
+								boarded_from = key
+						# not yet riding any segment, which the full mask stands for
+						if -1 not in riding or boarding_time < riding[-1][0]:
+							riding[-1] = (boarding_time, (position, boarded_from))
+					
+					mask = masks[position]
+					if segment_masks is not None:
+						mask = segment_masks.get((pattern, position), mask)
+					if not mask & line_bit:
+						riding.clear()
+						continue
+					
+					travel_time = travel_times[position]
+					moved = {}
+					for ridden, (time, boarding) in riding.items():
+						next_mask = ridden & mask
+						time += travel_time
+						if time < target_time and (next_mask not in moved or time < moved[next_mask][0]):
+							moved[next_mask] = (time, boarding)
+					riding = moved
+			
+			rounds.append(labels)
+		
+		return rounds
+	
+	def route(self,
+		rounds: list[dict],
+		key: tuple[int, str],
+		round_index: int
+	) -> tuple[list[set[str]], list[str]]:
+		"""
+		Reconstructs a journey found by `self.search`, in the format of
+		`TransitGraph.line_expanded_route`.
+		:param rounds: The labels returned by the search
+		:param key: The label of the last station of the journey
+		:param round_index: The round the label was found in
+		"""
+		stations = []
+		lines_used = []
+		while round_index > 0:
+			_, (pattern, board_position, alight_position, mask, key) = rounds[round_index][key]
+			stops = self.pattern_stops[pattern]
+			stations[:0] = [self.stations[stop] for stop in stops[board_position + 1:alight_position + 1]]
+			lines_used.insert(0, set(self.registry.lines(mask)))
+			round_index -= 1
+		stations.insert(0, self.stations[key[0]])
+		return lines_used, stations
+	
+	def pareto_journeys(self,
+		source: str,
+		targets: list[str] = None,
+		max_transfers: int = None,
+		removed_stations: set[int] = frozenset(),
+		segment_masks: dict[tuple[int, int], int] = None
+	) -> dict[str, list[tuple[list[set[str]], float, list[str], int]]]:
+		"""
+		The Pareto optimal journeys from a source to every target, with a single search.
+		:param source: The source station
+		:param targets: The target stations, all stations if left empty
+		:param max_transfers: The maximum # of transfers, unlimited if left empty.
+		:param removed_stations: see `self.overlay`
+		:param segment_masks: see `self.overlay`
+		:return: The journeys to each reachable target, ordered from the fewest transfers to
+			the fastest. Each journey is in the format of `TransitGraph.fastest_path`, followed
+			by its # of transfers. A journey is only included if it is faster than every journey
+			with fewer transfers.
+		:raise nx.NodeNotFound: If the source or any target is not in the graph or removed.
+		"""
+		if targets is None:
+			targets = [station for station in self.stations if self.station_ids[station] not in removed_stations]
+		for station in [source, *targets]:
+			if station not in self.station_ids or self.station_ids[station] in removed_stations:
+				raise nx.NodeNotFound(f'Station {station} is not in the graph')
+		
+		source_id = self.station_ids[source]
+		target_id = self.station_ids[targets[0]] if len(targets) == 1 else -1
+		rounds = self.search(source_id, target_id, max_transfers, removed_stations, segment_masks)
+		
+		# the fastest label of every station in each round
+		round_bests: list[dict[int, tuple[float, tuple]]] = []
+		for labels in rounds:
+			bests = {}
+			for key, (time, _) in labels.items():
+				if key[0] not in bests or time < bests[key[0]][0]:
+					bests[key[0]] = (time, key)
+			round_bests.append(bests)
+		
+		journeys = {}
+		for target in targets:
+			target_id = self.station_ids[target]
+			if target_id == source_id:
+				journeys[target] = [([], 0.0, [target], 0)]
+				continue
+			options = []
+			for round_index, bests in enumerate(round_bests):
+				if target_id in bests and (not options or bests[target_id][0] < options[-1][1]):
+					time, key = bests[target_id]
+					lines, stations = self.route(rounds, key, round_index)
+					options.append((lines, time, stations, round_index - 1))
+			if options:
+				journeys[target] = options
+		return journeys
@@ -0,0 +1,104 @@
+import json
+import pickle
+import sqlite3
+from hashlib import sha256
+
+
+class ResultStore:
+	def __init__(self, path: str, run: dict):
+		"""
+		Results of `schedule_disruptions` kept in a SQLite database, so an interrupted run or a
+		run with extra disruptions reuses everything already computed. Every result is stored
+		as soon as it is computed, under a key hashed from the settings of the run & the
+		disruptions, see `self.key`. Results of other settings never match, so a single file
+		can hold many runs.
+		:param path: The database file, created if it does not exist
+		:param run: Every setting the results depend on, such as the network hash, seed, # of
+			journeys & routing method. Must be JSON serializable.
+		"""
+		self.run = run
+		self.connection = sqlite3.connect(path)
+		with self.connection:
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL, '
+				'combination TEXT NOT NULL, journeys INTEGER NOT NULL)'
+			)
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS singles (key TEXT PRIMARY KEY, result BLOB NOT NULL)'
+			)
+	
+	def key(self, disruptions: tuple, journeys: int = None) -> str:
+		"""
+		The hash identifying a result of some disruptions under the settings of this run. The
+		disruptions are made canonical first, see `canonical_disruption`, so neither the order
+		of the disruptions nor of the stations of a segment changes the key.
+		:param disruptions: The disruptions of a combination, or a single disruption in a tuple
+		:param journeys: # of journeys the result was computed on, if it differs per result
+		"""
+		description = {
+			'run': self.run,
+			'disruptions': sorted(canonical_disruption(disruption) for disruption in disruptions),
+			'journeys': journeys,
+		}
+		return sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+	
+	def score(self, combination: tuple, journeys: int) -> float | None:
+		"""
+		The stored score of a combination on its 1st `journeys` journeys, or None if it was not
+		computed yet.
+		"""
+		row = self.connection.execute(
+			'SELECT score FROM scores WHERE key = ?', (self.key(combination, journeys),)
+		).fetchone()
+		return None if row is None else row[0]
+	
+	def save_score(self, combination: tuple, journeys: int, score: float) -> None:
+		"""
+		Stores the score of a combination & commits it immediately.
+		"""
+		with self.connection:
+			self.connection.execute(
+				'INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)',
+				(
+					self.key(combination, journeys),
+					float(score),
+					json.dumps([canonical_disruption(disruption) for disruption in combination]),
+					journeys,
+				)
+			)
+	
+	def single(self, disruption: str | list) -> dict | None:
+		"""
+		The stored `single_result` of a disruption, or None if it was not computed yet.
+		"""
+		row = self.connection.execute(
+			'SELECT result FROM singles WHERE key = ?', (self.key((disruption,)),)
+		).fetchone()
+		return None if row is None else pickle.loads(row[0])
+	
+	def save_single(self, disruption: str | list, result: dict) -> None:
+		"""
+		Stores the `single_result` of a disruption & commits it immediately.
+		"""
+		with self.connection:
+			self.connection.execute(
+				'INSERT OR REPLACE INTO singles VALUES (?, ?)',
+				(self.key((disruption,)), pickle.dumps(result))
+			)
+	
+	def close(self) -> None:
+		self.connection.close()
+
+
+def canonical_disruption(disruption: str | list) -> list:
+	"""
+	A disruption in the format of `Simulator.disrupt` as a JSON serializable list that is the
+	same for every way of writing it: a station as `[station]` & a segment as its sorted
+	stations, followed by its sorted lines if only certain lines are removed.
+	"""
+	if isinstance(disruption, str):
+		return [disruption]
+	canonical = sorted(disruption[:2])
+	if len(disruption) == 3 and disruption[2]:
+		canonical.append(sorted(disruption[2]))
+	return canonical
@@ -0,0 +1,131 @@
+import numpy as np
+import networkx as nx
+from sys import argv
+from tqdm import tqdm
+from BinaryStore import write_store, read_store
+
+'''
+Increased whenever the layout of the route table or the search filling it changes, so older
+files are rejected.
+'''
+FORMAT_VERSION = 2
+DEFAULT_PATH = 'route_table.bin'
+
+
+def build_route_table(net, path: str = DEFAULT_PATH, loading_bars: bool = True) -> None:
+	"""
+	Precomputes the `line_expanded` journey of every origin & target pair of an undisrupted
+	`TransitGraph` & writes it to a binary file. Each journey is stored as its total time, the
+	ids of the stations visited & the ids of the sets of lines used. The file is keyed by
+	`TransitGraph.network_hash`, so a table is rejected once any line file changes.
+	:param net: An undisrupted `TransitGraph`
+	:param path: The file to write
+	:param loading_bars: whether to display a tqdm loading bar
+	"""
+	stations = sorted(net.nodes)
+	station_ids = {station: index for index, station in enumerate(stations)}
+	pair_count = len(stations) ** 2
+	
+	times = np.full(pair_count, np.nan)
+	path_offsets = np.zeros(pair_count + 1, dtype=np.uint64)
+	leg_offsets = np.zeros(pair_count + 1, dtype=np.uint64)
+	path_data: list[int] = []
+	leg_data: list[int] = []
+	# every distinct set of lines used in a leg is stored once in the header
+	line_set_ids: dict[frozenset, int] = {}
+	
+	origins = tqdm(stations, desc='Building route table') if loading_bars else stations
+	
+	for origin_id, origin in enumerate(origins):
+		labels, parents = net.line_expanded_search(origin)
+		for target_id, target in enumerate(stations):
+			pair = origin_id * len(stations) + target_id
+			if target in labels:
+				time, state = labels[target]
+				lines, route = net.line_expanded_route(state, parents)
+				times[pair] = time
+				path_data.extend(station_ids[station] for station in route)
+				for leg in lines:
+					leg_data.append(line_set_ids.setdefault(frozenset(leg), len(line_set_ids)))
+			path_offsets[pair + 1] = len(path_data)
+			leg_offsets[pair + 1] = len(leg_data)
+	
+	id_type = np.uint16 if max(len(stations), len(line_set_ids)) < 2 ** 16 else np.uint32
+	write_store(
+		path,
+		header={
+			'format': 'route_table',
+			'version': FORMAT_VERSION,
+			'network_hash': net.network_hash,
+			'stations': stations,
+			'line_sets': [sorted(lines) for lines in line_set_ids],
+		},
+		arrays={
+			'times': times,
+			'path_offsets': path_offsets,
+			'path_data': np.array(path_data, dtype=id_type),
+			'leg_offsets': leg_offsets,
+			'leg_data': np.array(leg_data, dtype=id_type),
+		}
+	)
+
+
+class RouteTable:
+	def __init__(self, path: str = DEFAULT_PATH, network_hash: str = None):
+		"""
+		Read-only view of a route table built by `build_route_table`. The file is memory
+		mapped, so any number of processes can share the same copy.
+		:param path: The file to read
+		:param network_hash: The `TransitGraph.network_hash` the table must have been built
+			for. Left empty, the table is not checked.
+		:raise ValueError: If the file is not a route table of this version or network.
+		"""
+		header, arrays = read_store(path)
+		if header.get('format') != 'route_table' or header.get('version') != FORMAT_VERSION:
+			raise ValueError(f'{path} is not a route table of version {FORMAT_VERSION}')
+		if network_hash is not None and header['network_hash'] != network_hash:
+			raise ValueError(
+				f'Route table {path} is stale, the line files have changed since it was built. '
+				'Rebuild it with `RouteTable.build_route_table`.'
+			)
+		
+		self.network_hash = header['network_hash']
+		self.stations: list[str] = header['stations']
+		self.station_ids = {station: index for index, station in enumerate(self.stations)}
+		self.line_sets: list[list[str]] = header['line_sets']
+		
+		self.times = arrays['times']
+		self.path_offsets = arrays['path_offsets']
+		self.path_data = arrays['path_data']
+		self.leg_offsets = arrays['leg_offsets']
+		self.leg_data = arrays['leg_data']
+	
+	def route(self, source: str, target: str) -> tuple[list[set[str]], float, list[str]]:
+		"""
+		Looks up a journey in the same format as `TransitGraph.fastest_path`.
+		:param source: The source station
+		:param target: The target station
+		:raise nx.NodeNotFound: If the source or target is not in the table.
+		:raise nx.NetworkXNoPath: If the target is not reachable from the source.
+		"""
+		for station in [source, target]:
+			if station not in self.station_ids:
+				raise nx.NodeNotFound(f'Station {station} is not in the route table')
+		
+		pair = self.station_ids[source] * len(self.stations) + self.station_ids[target]
+		time = float(self.times[pair])
+		if time != time:  # NaN
+			raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+		
+		path_ids = self.path_data[self.path_offsets[pair]:self.path_offsets[pair + 1]]
+		leg_ids = self.leg_data[self.leg_offsets[pair]:self.leg_offsets[pair + 1]]
+		return \
+			[set(self.line_sets[leg]) for leg in leg_ids.tolist()], \
+			time, \
+			[self.stations[station] for station in path_ids.tolist()]
+
+
+if __name__ == '__main__':
+	# usage: python RouteTable.py [path]
+	from TransitGraph import TransitGraph
+	build_route_table(TransitGraph(), argv[1] if len(argv) > 1 else DEFAULT_PATH)
@@ -1,7 +1,14 @@
 from itertools import combinations
-from Simulator import Simulator as Sim
+import numpy as np
+import networkx as nx
+from Simulator import Simulator as Sim, journey_stats
+from TransitGraph import TransitGraph as TG
+from JourneyStore import ROUTED
+from ResultStore import ResultStore
 from copy import deepcopy
 from sys import maxsize
+from math import ceil
+from typing import Callable
 from tqdm import tqdm
 
 
@@ -9,7 +16,15 @@ def schedule_disruptions(
 	disruptions: list[str | list[str | set]],
 	max_at_once: int = 2,
 	journey_count: int = 1_000,
-	paths_before_transfers: int = 10
+	paths_before_transfers: int = 10,
+	pairing: str = 'greedy',
+	routing: str = 'heuristic',
+	skip_independent: bool = None,
+	seed: int = None,
+	race_rounds: int = 1,
+	race_keep: float = 0.25,
+	result_store: str = None,
+	loading_bars: bool = True
 ) -> None:
 	"""
 	Takes in a list of disruptions & runs through every combination calculating the score.
@@ -21,6 +36,32 @@ def schedule_disruptions(
 		increases the accuracy of the disruption score.
 	:param paths_before_transfers: # of optimal paths to generate when calculating journey times
 		before calculating transfer times. This increases the accuracy of journey delay times.
+	:param pairing: How the closure order is chosen from the scored combinations:
+		
+		* greedy : Repeatedly take the lowest scoring combination that does not overlap with
+			the ones already taken.
+			
+		*
+			matching : Only for `max_at_once=2`. Finds the pairs with the lowest total score
+			through a minimum weight maximum cardinality matching, see `matching_plan`. The
+			total score of the greedy plan is printed for comparison.
+			
+	:param routing: see `TransitGraph.__init__()` for docs
+	:param skip_independent: Simulate every disruption alone first & only run the joint
+		simulation of a combination if its disruptions interact, see `interacting`. The
+		journeys of independent disruptions are simply combined. This is exact for the
+		routing methods of `TransitGraph.exact_routing_methods`, which it defaults to.
+	:param seed: Seed of the simulated journeys, see `Simulator.__init__()` for docs
+	:param race_rounds: With more than 1 round, the combinations are raced by successive
+		halving, see `race_combinations`. Only the contenders of the last round are scored
+		with all `journey_count` journeys.
+	:param race_keep: Fraction of the combinations kept after each round of the race. The
+		journeys of each round grow by the inverse of this fraction.
+	:param result_store: Path of a SQLite database keeping every score & single disruption
+		result as soon as it is computed, see `ResultStore`. A repeated, interrupted or
+		extended run with the same settings then only simulates what is missing. Requires a
+		`seed`, since the journeys of unseeded runs differ.
+	:param loading_bars: whether to display tqdm loading bars
 	"""
 	
 	def min_index_with_none(input_list: list):
@@ -37,22 +78,83 @@ def schedule_disruptions(
 		return min_index
 	
 	assert 1 < max_at_once <= len(disruptions)
+	assert pairing in ['greedy', 'matching'], 'Pairing must be either greedy or matching'
+	assert pairing == 'greedy' or max_at_once == 2, 'Matching only supports max_at_once=2'
+	assert race_rounds >= 1 and 0 < race_keep < 1
+	assert result_store is None or seed is not None, 'A result store requires a seed'
+	
+	if skip_independent is None:
+		skip_independent = routing in TG.exact_routing_methods
 	
 	# get all combinations of disruptions
 	comb = list(combinations(disruptions, max_at_once))
+	comb_indices = list(combinations(range(len(disruptions)), max_at_once))
+	
+	# every combination is scored against the same journeys, making the scores comparable.
+	# These are only simulated once a result is missing from the result store.
+	sim = Sim(journey_count, paths_before_transfers, loading_bars=False, routing=routing, seed=seed)
+	
+	store = None
+	if result_store is not None:
+		store = ResultStore(result_store, {
+			'network_hash': sim.net.network_hash,
+			'seed': seed,
+			'journey_count': journey_count,
+			'paths_before_transfers': paths_before_transfers,
+			'routing': routing,
+			'skip_independent': skip_independent,
+		})
 	
-	sim = Sim(journey_count, paths_before_transfers, loading_bars=False)
+	# the single results are only needed to compute scores missing from the store, so they
+	# are loaded or simulated the first time a combination has to be computed
+	singles = {}
+	
+	def load_singles() -> dict[int, dict]:
+		if not skip_independent or singles:
+			return singles
+		disruptions_bar = tqdm(disruptions, desc='Running single disruptions') \
+			if loading_bars else disruptions
+		for index, disruption in enumerate(disruptions_bar):
+			singles[index] = None if store is None else store.single(disruption)
+			if singles[index] is None:
+				if len(sim.journeys) == 0:
+					sim.simulate_journeys()
+				sim.clear_disruptions()
+				sim.disrupt(disruption)
+				sim.simulate_disruption()
+				singles[index] = single_result(sim)
+				if store is not None:
+					store.save_single(disruption, singles[index])
+		return singles
 	
 	# collect scores of each pair
-	scores = []
+	try:
+		if race_rounds > 1:
+			scores, joint_runs = race_combinations(
+				sim, comb, comb_indices, load_singles, race_rounds, race_keep,
+				# enough contenders for a full plan
+				min_contenders=len(disruptions) // max_at_once,
+				store=store,
+				loading_bars=loading_bars
+			)
+		else:
+			scores = []
+			joint_runs = 0
+			combos = zip(comb, comb_indices)
+			if loading_bars:
+				combos = tqdm(combos, desc='Running combinations', total=len(comb))
+			for combo, indices in combos:
+				score, joint = combination_score(sim, combo, indices, load_singles, journey_count, store)
+				scores.append(score)
+				joint_runs += joint
+	finally:
+		if store is not None:
+			store.close()
 	
-	for combo in tqdm(comb, desc='Running combinations'):
-		sim.reset_graph()
-		sim.simulate_journeys()
-		for disruption in combo:
-			sim.disrupt(disruption)
-		sim.simulate_disruption()
-		scores.append(sim.get_stats()['score'])
+	if skip_independent:
+		print(f'{joint_runs} joint simulations were needed for {len(comb)} combinations')
+	if store is not None and len(sim.journeys) == 0:
+		print('All scores were reused from the result store')
 		
 	disruptions_left = deepcopy(disruptions)
 	disrupt_combos_left = deepcopy(comb)
@@ -86,9 +188,220 @@ def schedule_disruptions(
 			disrupt_combos_left[removal_index] = None
 			scores_left[removal_index] = None
 	
+	greedy_score = sum(scores[index] for index in best_indices)
+	if pairing == 'matching':
+		best_indices = matching_plan(comb_indices, scores)
+		paired = [disruption for index in best_indices for disruption in comb[index]]
+		disruptions_left = [
+			disruption for disruption in disruptions if disruption not in paired
+		]
+	
 	print('Recommended closure order:')
 	for index in best_indices:
 		print(comb[index])
 		
 	for disruption in disruptions_left:
 		print(disruption)
+	
+	plan_score = sum(scores[index] for index in best_indices)
+	if pairing == 'matching':
+		print(f'Total plan score: {plan_score} (greedy: {greedy_score})')
+	else:
+		print(f'Total plan score: {plan_score}')
+
+
+def combination_score(
+	sim: Sim,
+	combo: tuple,
+	indices: tuple[int, ...],
+	singles: Callable[[], dict[int, dict]],
+	count: int,
+	store: ResultStore = None
+) -> tuple[float, bool]:
+	"""
+	Scores a combination of disruptions on the first `count` journeys of the simulator.
+	:param sim: A simulator, whose journeys are simulated once they are needed
+	:param combo: The disruptions of the combination
+	:param indices: The indices of the disruptions in `singles`
+	:param singles: Returns the `single_result` of every disruption by index, or an empty
+		dictionary to always run the joint simulation. Only called if the score is computed.
+	:param count: # of journeys to score on. Since the journeys are drawn independently, the
+		first journeys are a smaller random sample of all journeys.
+	:param store: Looked up before & updated after computing the score
+	:return: The score & whether a joint simulation was needed.
+	"""
+	if store is not None:
+		score = store.score(combo, count)
+		if score is not None:
+			return score, False
+	
+	score, joint = _combination_score(sim, combo, indices, singles(), count)
+	if store is not None:
+		store.save_score(combo, count, score)
+	return score, joint
+
+
+def _combination_score(
+	sim: Sim,
+	combo: tuple,
+	indices: tuple[int, ...],
+	singles: dict[int, dict],
+	count: int
+) -> tuple[float, bool]:
+	"""
+	Computes the score of `combination_score`.
+	"""
+	if len(sim.journeys) == 0:
+		sim.simulate_journeys()
+	time = sim.journeys.times[:count]
+	if singles and not any(
+		interacting(singles[first], singles[second])
+		for first, second in combinations(indices, 2)
+	):
+		# no journey is affected by more than 1 disruption, so their results are combined
+		time_new = time.copy()
+		status = np.full(count, ROUTED, dtype=np.int8)
+		for index in indices:
+			sample = singles[index]['affected'] < count
+			affected = singles[index]['affected'][sample]
+			time_new[affected] = singles[index]['time_new'][sample]
+			status[affected] = singles[index]['status'][sample]
+		return journey_stats(time, time_new, status)['score'], False
+	
+	sim.clear_disruptions()
+	for disruption in combo:
+		sim.disrupt(disruption)
+	sim.reroute_journeys(range(count))
+	stats = journey_stats(time, sim.journeys.times_new[:count], sim.journeys.status[:count])
+	return stats['score'], True
+
+
+def race_combinations(
+	sim: Sim,
+	comb: list[tuple],
+	comb_indices: list[tuple[int, ...]],
+	singles: Callable[[], dict[int, dict]],
+	rounds: int,
+	keep: float,
+	min_contenders: int = 1,
+	store: ResultStore = None,
+	loading_bars: bool = True
+) -> tuple[list[float], int]:
+	"""
+	Successive halving over the combinations. The 1st round scores all combinations on a
+	small prefix of the simulated journeys. After each round only the best `keep` fraction
+	stays in the race, & the next round scores them on `1 / keep` times as many journeys,
+	until the last round uses all journeys. Combinations dropped earlier keep the score of
+	their last round, scaled up to the full # of journeys, so they can still be picked later
+	on in the plan.
+	:param sim: see `combination_score()` for docs
+	:param comb: The disruptions of each combination
+	:param comb_indices: The indices of the disruptions of each combination in `singles`
+	:param singles: see `combination_score()` for docs
+	:param rounds: # of rounds in the race
+	:param keep: Fraction of the combinations kept after each round
+	:param min_contenders: Never keep fewer combinations than this
+	:param store: see `combination_score()` for docs
+	:param loading_bars: whether to display a tqdm loading bar per round
+	:return: The score of each combination & the # of joint simulations run.
+	"""
+	journey_count = sim.journey_count
+	scores = [None] * len(comb)
+	contenders = list(range(len(comb)))
+	joint_runs = 0
+	
+	for race_round in range(rounds):
+		count = max(1, round(journey_count * keep ** (rounds - 1 - race_round)))
+		round_contenders = tqdm(
+			contenders, desc=f'Race round {race_round + 1} with {count} journeys'
+		) if loading_bars else contenders
+		for index in round_contenders:
+			score, joint = combination_score(
+				sim, comb[index], comb_indices[index], singles, count, store
+			)
+			# the score grows with the # of journeys
+			scores[index] = score * journey_count / count
+			joint_runs += joint
+		
+		contenders.sort(key=lambda index: scores[index])
+		contenders = contenders[:max(ceil(len(contenders) * keep), min_contenders)]
+	
+	return scores, joint_runs
+
+
+def single_result(sim: Sim) -> dict:
+	"""
+	Records the results of a simulated disruption for `interacting` & for combining them with
+	other disruptions in `schedule_disruptions`.
+	:param sim: A simulator after `Simulator.simulate_disruption`
+	:return: A dictionary of the following keys:
+		
+		* affected : The indices of the journeys rerouted by the disruption.
+		
+		* time_new, status : Their journey times & status after the disruption.
+		
+		* stations, segments : The removed stations & segments, see `Simulator.disrupted_elements`
+		
+		*
+			rerouted_stations, rerouted_segments : The stations & segments the rerouted journeys
+			now pass through.
+		
+		Stations are given by name, since the station ids of `Simulator.journeys` depend on the
+		order disruptions were simulated in, while these results are kept in a `ResultStore`.
+	"""
+	names = sim.journeys.stations
+	
+	def by_name(stations: set[int], segments: set[tuple[int, int]]) -> tuple[set, set]:
+		return (
+			{names[station] for station in stations},
+			{tuple(sorted((names[station1], names[station2]))) for station1, station2 in segments}
+		)
+	
+	affected = np.array(sim.affected_journeys(), dtype=np.int64)
+	stations, segments = sim.disrupted_elements()
+	rerouted_stations, rerouted_segments = by_name(*sim.journey_elements(affected.tolist(), new=True))
+	return {
+		'affected': affected,
+		'time_new': sim.journeys.times_new[affected],
+		'status': sim.journeys.status[affected],
+		'stations': stations,
+		'segments': segments,
+		'rerouted_stations': rerouted_stations,
+		'rerouted_segments': rerouted_segments,
+	}
+
+
+def interacting(first: dict, second: dict) -> bool:
+	"""
+	Whether 2 disruptions have to be simulated together. This is the case if any journey is
+	affected by both, or if the journeys rerouted around one of them now pass through the
+	other. Otherwise every journey has the same result in the joint simulation as in the
+	single simulation that affects it.
+	:param first: `single_result` of the 1st disruption
+	:param second: `single_result` of the 2nd disruption
+	"""
+	if np.intersect1d(first['affected'], second['affected']).size > 0:
+		return True
+	for one, other in [(first, second), (second, first)]:
+		if not one['rerouted_stations'].isdisjoint(other['stations']):
+			return True
+		if not one['rerouted_segments'].isdisjoint(other['segments']):
+			return True
+	return False
+
+
+def matching_plan(pairs: list[tuple[int, int]], scores: list[float]) -> list[int]:
+	"""
+	Chooses the pairs of disruptions with the lowest total score, as long as the most pairs
+	possible are closed. The scored pairs form a complete graph over the disruptions, on which
+	`nx.min_weight_matching` finds the minimum weight maximum cardinality matching.
+	:param pairs: The indices of both disruptions of each scored pair
+	:param scores: The score of each pair
+	:return: The indices of the chosen pairs, from lowest to highest score.
+	"""
+	graph = nx.Graph()
+	for index, (first, second) in enumerate(pairs):
+		graph.add_edge(first, second, weight=scores[index], index=index)
+	
+	chosen = [graph[first][second]['index'] for first, second in nx.min_weight_matching(graph)]
+	return sorted(chosen, key=lambda index: scores[index])
@@ -0,0 +1,445 @@
+import asyncio
+import json
+import numpy as np
+import networkx as nx
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from TransitGraph import TransitGraph as TG
+from Simulator import Simulator
+from Metrics import Metrics
+from ResultStore import canonical_disruption
+
+
+class RoutingService:
+	def __init__(self,
+		routing: str = 'astar',
+		batch_window: float = .002,
+		max_batch: int = 256,
+		max_score_journeys: int = 20_000,
+		max_simulators: int = 2
+	):
+		"""
+		A long running HTTP service on top of a warm `TransitGraph`, so consumers do not pay the
+		loading cost of the graph for every query. All endpoints answer with JSON:
+		
+		* GET /route?source=&target= : The fastest journey, see `self.route`. Optional
+			parameters are `method`, `pareto` to get `TransitGraph.pareto_journeys` instead &
+			`max_transfers` for these.
+		
+		* GET /stations?query=&k= : The closest station names, see `FuzzyFunctions.StationIndex`
+		
+		*
+			POST /score : The statistics of a what-if disruption, see `self.score`. The body
+			holds the keys `disruptions`, in the format of `Simulator.disrupt`, & optionally
+			`journeys` & `seed`.
+		
+		* GET /metrics : The counters of the service & the routing metrics of the graph
+		
+		* GET /health : Whether the service is up & the # of stations
+		
+		Route queries arriving within `batch_window` of each other are coalesced into a single
+		batch. Identical queries still in flight share a single result, & the remaining ones
+		are grouped by source, so every source takes a single search for all of its targets,
+		see `TransitGraph.fastest_paths_from`. The routing itself runs on a single worker
+		thread, so the event loop keeps accepting requests meanwhile.
+		:param routing: Routing method of queries not asking for one, see
+			`TransitGraph.routing_methods`. With the default `astar`, a source with a single
+			target is routed by A* & a source with many targets by a single `line_expanded`
+			search.
+		:param batch_window: Seconds to wait for more queries before routing a batch
+		:param max_batch: Maximum # of distinct queries routed in a single batch
+		:param max_score_journeys: Maximum # of journeys a single score request may simulate
+		:param max_simulators: # of warm simulators kept for score requests, each holding its
+			own graph & journeys. The least recently used one is dropped beyond this.
+		"""
+		self.net = TG(routing=routing)
+		self.net.metrics.enabled = True
+		# built now, since lookups run on the event loop while routing runs on the worker
+		self.net.station_index()
+		self.routing = routing
+		self.batch_window = batch_window
+		self.max_batch = max_batch
+		self.max_score_journeys = max_score_journeys
+		self.max_simulators = max_simulators
+		self.metrics = Metrics(enabled=True)
+		
+		# (kind, source, target, method, max_transfers) -> result of queries in flight
+		self._in_flight: dict[tuple, asyncio.Future] = {}
+		self._queue: list[tuple] = []
+		self._wakeup: asyncio.Event | None = None
+		self._routing_executor = ThreadPoolExecutor(1, thread_name_prefix='routing')
+		
+		# warm simulators by (journeys, seed) from least to most recently used, & score requests
+		# in flight
+		self._simulators: dict[tuple[int, int], Simulator] = {}
+		self._scores_in_flight: dict[tuple, asyncio.Future] = {}
+		self._score_executor = ThreadPoolExecutor(1, thread_name_prefix='scoring')
+	
+	async def route(self,
+		source: str,
+		target: str,
+		method: str = None,
+		pareto: bool = False,
+		max_transfers: int = None
+	) -> dict | list[dict]:
+		"""
+		Routes a single query through the batcher.
+		:param source: The source station
+		:param target: The target station
+		:param method: The routing method, defaults to `self.routing`
+		:param pareto: Return `TransitGraph.pareto_journeys` instead of the fastest journey
+		:param max_transfers: see `TransitGraph.pareto_journeys` for docs
+		:return: The journey in the format of `journey_json`, or a list of them with `pareto`.
+		:raise nx.NodeNotFound: If the source or target is not in the graph.
+		:raise nx.NetworkXNoPath: If the target cannot be reached.
+		:raise ValueError: If the routing method is unknown.
+		"""
+		if method is None:
+			method = self.routing
+		if method not in self.net.routing_methods:
+			raise ValueError(f'Unknown routing method {method}, use one of {self.net.routing_methods}')
+		for station in [source, target]:
+			if not self.net.has_station(station):
+				raise nx.NodeNotFound(station)
+		
+		key = ('pareto' if pareto else 'fastest', source, target, method, max_transfers if pareto else None)
+		self.metrics.count('route_requests')
+		if key in self._in_flight:
+			self.metrics.count('deduplicated')
+			return await asyncio.shield(self._in_flight[key])
+		
+		self._in_flight[key] = asyncio.get_running_loop().create_future()
+		self._queue.append(key)
+		self._wakeup.set()
+		return await asyncio.shield(self._in_flight[key])
+	
+	async def _batch_loop(self) -> None:
+		"""
+		Routes the queued queries in batches, for as long as the service runs.
+		"""
+		loop = asyncio.get_running_loop()
+		while True:
+			await self._wakeup.wait()
+			# give concurrent requests the chance to join the batch
+			await asyncio.sleep(self.batch_window)
+			batch = self._queue[:self.max_batch]
+			del self._queue[:self.max_batch]
+			if not self._queue:
+				self._wakeup.clear()
+			
+			self.metrics.count('batches')
+			self.metrics.count('batched_queries', len(batch))
+			try:
+				results = await loop.run_in_executor(self._routing_executor, self._route_batch, batch)
+			except Exception as exception:
+				results = {key: exception for key in batch}
+			
+			for key in batch:
+				future = self._in_flight.pop(key)
+				if isinstance(results[key], Exception):
+					future.set_exception(results[key])
+				else:
+					future.set_result(results[key])
+	
+	def _route_batch(self, batch: list[tuple]) -> dict[tuple, dict | list | Exception]:
+		"""
+		Routes a batch of distinct queries on the routing thread, grouped by source.
+		:return: The JSON result or the exception of every query.
+		"""
+		groups: dict[tuple, list[tuple]] = {}
+		for key in batch:
+			kind, source, target, method, max_transfers = key
+			groups.setdefault((kind, source, method, max_transfers), []).append(key)
+		
+		results = {}
+		for (kind, source, method, max_transfers), keys in groups.items():
+			targets = [key[2] for key in keys]
+			try:
+				if kind == 'pareto':
+					journeys = {
+						target: [journey_json(*journey) for journey in options]
+						for target, options in
+						self.net.pareto_journeys_from(source, targets, max_transfers).items()
+					}
+				elif len(targets) == 1:
+					journeys = {targets[0]: journey_json(
+						*self.net.fastest_path(source, targets[0], sim_mode=True, method=method)
+					)}
+				else:
+					journeys = {
+						target: journey_json(*journey)
+						for target, journey in self.net.fastest_paths_from(source, targets, method).items()
+					}
+			except (nx.NetworkXNoPath, nx.NodeNotFound, ValueError) as exception:
+				for key in keys:
+					results[key] = exception
+				continue
+			
+			for key in keys:
+				if key[2] in journeys:
+					results[key] = journeys[key[2]]
+				else:
+					results[key] = nx.NetworkXNoPath(f'No path between {source} and {key[2]}.')
+		return results
+	
+	def stations(self, query: str, k: int = 5) -> list[dict]:
+		"""
+		The closest station names to a query, see `FuzzyFunctions.StationIndex.top_k`.
+		"""
+		return [
+			{'station': station, 'score': score}
+			for station, score in self.net.station_index().top_k(query, k, threshold=0)
+		]
+	
+	async def score(self, disruptions: list, journeys: int = 1_000, seed: int = 0) -> dict:
+		"""
+		Scores a what-if disruption on a warm simulator, see `Simulator.get_stats`. Simulators
+		keep their journeys per # of journeys & seed, so later requests only route the
+		journeys affected by their disruption. Identical requests in flight share a result.
+		:param disruptions: A list of disruptions in the format of `Simulator.disrupt`, where
+			the lines of a segment are given as a list
+		:param journeys: # of journeys to simulate
+		:param seed: Seed of the journeys, so scores of different requests are comparable
+		:raise ValueError: If a disruption is malformed or too many journeys are requested.
+		:raise nx.NodeNotFound: If a station of a disruption is not in the graph.
+		"""
+		if not 0 < journeys <= self.max_score_journeys:
+			raise ValueError(f'journeys must be between 1 & {self.max_score_journeys}')
+		if not isinstance(disruptions, list) or not disruptions:
+			raise ValueError('disruptions must be a non empty list')
+		
+		parsed = []
+		for disruption in disruptions:
+			if isinstance(disruption, str):
+				if not self.net.has_station(disruption):
+					raise nx.NodeNotFound(disruption)
+				parsed.append(disruption)
+				continue
+			if not isinstance(disruption, list) or len(disruption) not in [2, 3]:
+				raise ValueError(f'Disruption {disruption} must be a station or a list of 2 stations & optional lines')
+			for station in disruption[:2]:
+				if not isinstance(station, str) or not self.net.has_station(station):
+					raise nx.NodeNotFound(station)
+			lines = set(disruption[2]) if len(disruption) == 3 and disruption[2] else None
+			if self.net.has_edge(*disruption[:2]):
+				if not self.net.has_segment(*disruption[:2]):
+					raise ValueError(f'Segment {disruption[0]} - {disruption[1]} is already removed')
+				if lines is not None and not lines <= self.net.segment_lines(*disruption[:2]):
+					raise ValueError(f'Lines {lines} do not all serve {disruption[0]} - {disruption[1]}')
+			else:
+				connecting = set(self.net.lines_between(*disruption[:2]))
+				if not connecting or lines is not None and not lines <= connecting:
+					raise ValueError(
+						f'Lines {lines or "any"} do not connect {disruption[0]} & {disruption[1]} without a break'
+					)
+			parsed.append([*disruption[:2], lines])
+		
+		key = (
+			tuple(sorted(json.dumps(canonical_disruption(disruption)) for disruption in parsed)),
+			journeys,
+			seed
+		)
+		self.metrics.count('score_requests')
+		if key in self._scores_in_flight:
+			self.metrics.count('deduplicated')
+			return await asyncio.shield(self._scores_in_flight[key])
+		
+		loop = asyncio.get_running_loop()
+		future = self._scores_in_flight[key] = loop.create_future()
+		try:
+			future.set_result(
+				await loop.run_in_executor(self._score_executor, self._score, parsed, journeys, seed)
+			)
+		except Exception as exception:
+			future.set_exception(exception)
+		finally:
+			del self._scores_in_flight[key]
+		return await asyncio.shield(future)
+	
+	def _score(self, disruptions: list, journeys: int, seed: int) -> dict:
+		"""
+		Simulates a what-if disruption on the scoring thread.
+		"""
+		sim = self._simulators.pop((journeys, seed), None)
+		if sim is None:
+			if len(self._simulators) >= self.max_simulators:
+				del self._simulators[next(iter(self._simulators))]
+			sim = Simulator(journeys, loading_bars=False, routing=self.routing, seed=seed)
+			sim.simulate_journeys()
+		self._simulators[(journeys, seed)] = sim
+		
+		sim.clear_disruptions()
+		for disruption in disruptions:
+			if isinstance(disruption, str):
+				sim.disrupt_station(disruption)
+			else:
+				sim.disrupt_segment(*disruption)
+		sim.simulate_disruption()
+		stats = sim.get_stats()
+		sim.clear_disruptions()
+		return json_safe(stats)
+	
+	async def dispatch(self, method: str, path: str, body: bytes) -> tuple[int, dict | list]:
+		"""
+		Answers a single HTTP request.
+		:return: The status code & the JSON payload.
+		"""
+		url = urlsplit(path)
+		query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+		try:
+			if method == 'GET' and url.path == '/route':
+				if 'source' not in query or 'target' not in query:
+					return 400, {'error': 'source & target are required'}
+				max_transfers = query.get('max_transfers')
+				return 200, await self.route(
+					query['source'],
+					query['target'],
+					query.get('method'),
+					query.get('pareto', 'false').lower() in ['1', 'true', 'yes'],
+					None if max_transfers is None else int(max_transfers)
+				)
+			if method == 'GET' and url.path == '/stations':
+				if 'query' not in query:
+					return 400, {'error': 'query is required'}
+				return 200, self.stations(query['query'], int(query.get('k', 5)))
+			if method == 'POST' and url.path == '/score':
+				request = json.loads(body or b'{}')
+				if not isinstance(request, dict):
+					return 400, {'error': 'The body must be a JSON object'}
+				return 200, await self.score(
+					request.get('disruptions'), int(request.get('journeys', 1_000)), request.get('seed', 0)
+				)
+			if method == 'GET' and url.path == '/metrics':
+				# the routing thread updates the metrics of the graph, so they are read there
+				graph = await asyncio.get_running_loop().run_in_executor(
+					self._routing_executor, self.net.metrics.snapshot
+				)
+				return 200, json_safe({'service': self.metrics.snapshot(), 'graph': graph})
+			if method == 'GET' and url.path == '/health':
+				return 200, {'status': 'ok', 'stations': self.net.number_of_nodes()}
+			return 404, {'error': f'No endpoint {method} {url.path}'}
+		except nx.NodeNotFound as exception:
+			station = str(exception.args[0]) if exception.args else ''
+			return 404, {
+				'error': f'Station {station} is not in the graph',
+				'suggestions': [match['station'] for match in self.stations(station, 5)],
+			}
+		except nx.NetworkXNoPath as exception:
+			return 404, {'error': str(exception)}
+		except (ValueError, TypeError) as exception:
+			return 400, {'error': str(exception)}
+	
+	async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		"""
+		Serves the HTTP/1.1 requests of a single connection, keeping it open between requests
+		unless the client asks to close it.
+		"""
+		try:
+			while request_line := await reader.readline():
+				try:
+					method, path, version = request_line.decode('latin-1').split()
+				except ValueError:
+					await self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+					break
+				headers = {}
+				while (line := await reader.readline()) not in [b'\r\n', b'\n', b'']:
+					name, _, value = line.decode('latin-1').partition(':')
+					headers[name.strip().lower()] = value.strip()
+				length = headers.get('content-length', '0')
+				if not length.isdigit():
+					await self._respond(writer, 400, {'error': 'Malformed Content-Length'}, False)
+					break
+				body = await reader.readexactly(int(length))
+				
+				status, payload = await self.dispatch(method, path, body)
+				keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+				await self._respond(writer, status, payload, keep_alive)
+				if not keep_alive:
+					break
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+	
+	@staticmethod
+	async def _respond(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool) -> None:
+		"""
+		Writes a JSON response.
+		"""
+		data = json.dumps(payload).encode()
+		writer.write(
+			f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+			'Content-Type: application/json\r\n'
+			f'Content-Length: {len(data)}\r\n'
+			f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data
+		)
+		await writer.drain()
+	
+	async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.Server:
+		"""
+		Starts listening & batching in the running event loop.
+		:param host: The address to bind, only the local machine by default
+		:param port: The port to bind, or 0 for any free port
+		:return: The server, whose `sockets` hold the bound address.
+		"""
+		self._wakeup = asyncio.Event()
+		self._batcher = asyncio.create_task(self._batch_loop())
+		return await asyncio.start_server(self.handle_connection, host, port)
+	
+	async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+		"""
+		Runs the service until it is cancelled, see `self.start`.
+		"""
+		server = await self.start(host, port)
+		print(f'Serving {self.net.number_of_nodes()} stations on http://{host}:{server.sockets[0].getsockname()[1]}')
+		async with server:
+			await server.serve_forever()
+
+
+def journey_json(
+	lines: list[set[str]],
+	time: float,
+	stations: list[str],
+	transfers: int = None
+) -> dict:
+	"""
+	A journey in the format of `TransitGraph.fastest_path` as JSON, with the lines of every
+	leg as a sorted list.
+	"""
+	journey = {'lines': [sorted(leg) for leg in lines], 'time': time, 'stations': stations}
+	if transfers is not None:
+		journey['transfers'] = transfers
+	return journey
+
+
+def json_safe(value):
+	"""
+	Converts NumPy numbers & tuples to plain JSON values, where NaN becomes null.
+	"""
+	if isinstance(value, dict):
+		return {key: json_safe(item) for key, item in value.items()}
+	if isinstance(value, (list, tuple)):
+		return [json_safe(item) for item in value]
+	if isinstance(value, (float, np.floating)):
+		return None if np.isnan(value) else float(value)
+	if isinstance(value, np.integer):
+		return int(value)
+	return value
+
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description='Serves routing, station lookup & disruption scoring over HTTP.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--routing', default='astar')
+	parser.add_argument('--batch-window', type=float, default=2, help='milliseconds')
+	parser.add_argument('--max-batch', type=int, default=256)
+	args = parser.parse_args()
+	
+	service = RoutingService(args.routing, args.batch_window / 1000, args.max_batch)
+	try:
+		asyncio.run(service.serve(args.host, args.port))
+	except KeyboardInterrupt:
+		pass
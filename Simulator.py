@@ -1,9 +1,17 @@
 import numpy as np
 from FuzzyFunctions import find_possible_match
 from TransitGraph import TransitGraph as TG
-from random import sample
+from JourneyStore import JourneyStore, PENDING, ROUTED, CANCELED
+import JourneyStream
+from random import Random
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Iterator
+from itertools import islice
+from Metrics import Metrics
 import networkx as nx
 from tqdm import tqdm
+from multiprocessing import Pool
 from matplotlib import pyplot as plt
 
 
@@ -11,7 +19,13 @@ class Simulator:
 	def __init__(self,
 		journey_count: int = 1_000,
 		paths_before_transfers: int = 10,
-		loading_bars: bool = True
+		loading_bars: bool = True,
+		routing: str = 'heuristic',
+		route_table: str = None,
+		workers: int = 1,
+		seed: int = None,
+		metrics: bool = False,
+		trace: Callable[[dict], None] = None
 	):
 		"""
 		Handles simulation of many journeys in order to add a disruption & collect relevant
@@ -19,18 +33,58 @@ class Simulator:
 		:param journey_count: # of journeys to simulate
 		:param paths_before_transfers: see `TransitGraph.__init__()` for docs
 		:param loading_bars: whether to display tqdm loading bars. Used in `Scheduler.py`
+		:param routing: see `TransitGraph.__init__()` for docs
+		:param route_table: Path of a route table built by `RouteTable.build_route_table`. The
+			undisrupted journeys are then looked up instead of routed. Since the table holds
+			`line_expanded` journeys, this requires the same routing for disruptions.
+		:param workers: # of processes to route journeys with. Each worker loads its own graph
+			& applies the current disruptions once. On platforms which spawn instead of fork
+			processes, the calling script needs an `if __name__ == '__main__':` guard.
+		:param seed: Seed of the random origin & target stations. Simulators with the same seed
+			& network draw the same stream of journeys, so their scores can be compared without
+			the noise of different samples. Resetting the graph restarts the stream.
+		:param metrics: Collect the counters & timers of `self.get_metrics`. Routing done by
+			worker processes is only included in the timers of the simulator itself.
+		:param trace: Called for every journey routed in this process, see `Metrics.__init__`
 		"""
+		assert route_table is None or routing == 'line_expanded', \
+			'A route table can only be compared against `line_expanded` routing'
+		
 		self.journey_count = journey_count
-		self.net = TG(paths_before_transfers)
-		self.journeys: list[dict] = []
+		self.paths_before_transfers = paths_before_transfers
+		self.routing = routing
+		self.route_table = route_table
+		self.metrics = Metrics(metrics, trace)
+		self.net = self.load_graph()
+		self.journeys = JourneyStore()
+		# journey indices by station id & segment, built by `self.index_journeys`
+		self.station_journeys: dict[int, list[int]] | None = None
+		self.segment_journeys: dict[tuple[int, int], list[int]] | None = None
 		
 		self.removed_stations = []
+		self.removed_segments: list[frozenset] = []
+		# arguments of every applied `self.disrupt_station` & `self.disrupt_segment` call
+		self.disruptions: list[list] = []
 		
 		# flags
 		self.disruption = False
 		self.disruption_ran = False
 		
 		self.loading_bars = loading_bars
+		self.workers = workers
+		self.seed = seed
+		self.random = Random(seed)
+	
+	def load_graph(self) -> TG:
+		"""
+		Creates an undisrupted transit graph with the settings of this simulator.
+		"""
+		net = TG(self.paths_before_transfers, routing=self.routing)
+		net.metrics.enabled = self.metrics.enabled
+		net.metrics.trace = self.metrics.trace
+		if self.route_table is not None:
+			net.load_route_table(self.route_table)
+		return net
 	
 	def reset_graph(self, new_journey_count: int = None) -> None:
 		"""
@@ -40,10 +94,30 @@ class Simulator:
 		"""
 		if new_journey_count is not None:
 			self.journey_count = new_journey_count
-		self.net = TG()
-		self.journeys = list()
+		self.net.clear_disruptions()
+		self.journeys = JourneyStore()
+		self.random = Random(self.seed)
+		self.station_journeys = None
+		self.segment_journeys = None
 		
 		self.removed_stations = []
+		self.removed_segments = []
+		self.disruptions = []
+		
+		self.disruption = False
+		self.disruption_ran = False
+	
+	def clear_disruptions(self) -> None:
+		"""
+		Undoes all disruptions & their simulated results, while keeping the simulated
+		journeys. This allows evaluating several disruptions against the same journeys.
+		"""
+		self.net.clear_disruptions()
+		self.journeys.clear_new()
+		
+		self.removed_stations = []
+		self.removed_segments = []
+		self.disruptions = []
 		
 		self.disruption = False
 		self.disruption_ran = False
@@ -51,36 +125,203 @@ class Simulator:
 	def simulate_journeys(self) -> None:
 		"""
 		Simulates a `self.journey_count` number of journeys with randomly initialized origin &
-		target destinations. This information is stored in the `self.journeys` dictionary.
+		target destinations. This information is stored in the `self.journeys` store. If a
+		route table was given, the journeys are looked up in it instead.
 		"""
 		
 		if len(self.journeys) != 0:
 			print('Error: journeys already simulated. Reset graph before simulating again.')
 			return
 		
-		iterator = tqdm(range(self.journey_count), desc='Simulating journeys') \
-			if self.loading_bars \
-			else range(self.journey_count)
+		self.add_journeys(self.journey_count)
+	
+	def add_journeys(self, count: int) -> range:
+		"""
+		Draws `count` more random journeys from `self.random` & routes them on the undisrupted
+		graph, also while disruptions are applied.
+		:return: The indices of the new journeys in `self.journeys`.
+		"""
+		if self.metrics.enabled:
+			start = perf_counter()
+		with self.undisrupted():
+			pairs = list(islice(self.journey_pairs(self.random), count))
+			method = 'table' if self.route_table is not None else None
+			results = self.route_journeys(pairs, 'Simulating journeys', method)
+		if self.metrics.enabled:
+			self.metrics.since('simulate_journeys', start)
+			self.metrics.count('journeys_simulated', count)
+		
+		start = len(self.journeys)
+		for (origin, target), result in zip(pairs, results):
+			if isinstance(result, Exception):
+				raise result
+			self.journeys.append(origin, target, *result)
+		
+		if self.station_journeys is not None:
+			self.index_journeys(start)
+		return range(start, len(self.journeys))
+	
+	def journey_pairs(self, random: Random) -> Iterator[tuple[str, str]]:
+		"""
+		Endless stream of random origin & target stations of the undisrupted graph. Stations are
+		drawn in sorted order, so a seed gives the same journeys however the graph was loaded.
+		:param random: The random generator to draw from
+		"""
+		stations_all = sorted(self.net.nodes)
+		while True:
+			yield tuple(random.sample(stations_all, k=2))
+	
+	def stream_journeys(self,
+		path: str,
+		count: int = None,
+		batch_size: int = 1_000,
+		resume: bool = True,
+		incremental: bool = None
+	) -> int:
+		"""
+		Simulates journeys without keeping them in `self.journeys`, for runs too large for
+		memory. Journeys are drawn lazily & routed in batches, each of which is appended to a
+		JSON lines file, see `JourneyStream.open_stream`. If a disruption is applied, every
+		batch is routed with it as well. Apply it with `self.disrupt_station` or
+		`self.disrupt_segment`, since `self.disrupt` simulates journeys in memory first.
+		
+		The journeys are drawn from the same stream as `self.simulate_journeys`. With a seed,
+		a resumed run skips exactly the journeys already in the file, so it ends up identical
+		to an uninterrupted run.
+		:param path: The file to write
+		:param count: # of journeys the file should hold, defaults to `self.journey_count`
+		:param batch_size: # of journeys routed & written at once, which bounds the memory used
+		:param resume: Keep the journeys of an existing file of the same run & only add the
+			missing ones. Otherwise the file is overwritten.
+		:param incremental: Only re-route journeys crossing a disrupted station or segment,
+			see `self.simulate_disruption()` for docs
+		:return: # of journeys in the file.
+		:raise ValueError: If resuming a file of a different network, routing settings, seed or
+			disruption.
+		"""
+		if count is None:
+			count = self.journey_count
+		incremental = self._incremental(incremental)
+		header = {
+			'network_hash': self.net.network_hash,
+			'routing': self.routing,
+			'paths_before_transfers': self.paths_before_transfers,
+			'route_table': self.route_table,
+			'incremental': incremental,
+			'seed': self.seed,
+			'disruptions': [
+				[*disruption[:2], sorted(disruption[2])] if len(disruption) == 3 and disruption[2]
+				else disruption[:2]
+				for disruption in self.disruptions
+			],
+		}
+		file, written = JourneyStream.open_stream(path, header, resume)
+		
+		# skip the journeys already written, which keeps the stream identical when seeded
+		pairs_all = islice(self.journey_pairs(Random(self.seed)), written, count)
+		removed_stations = set(self.removed_stations)
+		removed_segments = set(self.removed_segments)
+		loading_bar = tqdm(total=count, initial=written, desc='Streaming journeys') \
+			if self.loading_bars else None
+		# the workers load their graph once for all batches, with & without the disruption
+		pool_undisrupted = pool_disrupted = None
+		if self.workers > 1:
+			pool_undisrupted = self.worker_pool([])
+			if self.disruption:
+				pool_disrupted = self.worker_pool(self.disruptions)
+		try:
+			while pairs := list(islice(pairs_all, batch_size)):
+				with self.undisrupted():
+					method = 'table' if self.route_table is not None else None
+					results = self.route_journeys(pairs, None, method, pool_undisrupted)
+				
+				affected = []
+				for index, result in enumerate(results):
+					if isinstance(result, Exception):
+						raise result
+					stations = result[2]
+					if not incremental or not removed_stations.isdisjoint(stations) or any(
+						frozenset(segment) in removed_segments for segment in zip(stations, stations[1:])
+					):
+						affected.append(index)
+				
+				affected_indices = set(affected)
+				results_new = dict.fromkeys(range(len(pairs)))
+				if self.disruption:
+					rerouted = self.route_journeys([pairs[index] for index in affected], None, pool=pool_disrupted)
+					results_new.update(zip(affected, rerouted))
+				
+				journeys = []
+				for index, ((origin, target), result) in enumerate(zip(pairs, results)):
+					result_new = result if index not in affected_indices else results_new[index]
+					if not self.disruption:
+						status = PENDING
+					elif isinstance(result_new, Exception):
+						status, result_new = CANCELED, None
+					else:
+						status = ROUTED
+					journeys.append(JourneyStream.journey_record(origin, target, result, result_new, status))
+				JourneyStream.append_journeys(file, journeys)
+				
+				written += len(pairs)
+				if loading_bar is not None:
+					loading_bar.update(len(pairs))
+				if self.metrics.enabled:
+					self.metrics.count('journeys_streamed', len(pairs))
+		finally:
+			file.close()
+			for pool in [pool_undisrupted, pool_disrupted]:
+				if pool is not None:
+					pool.terminate()
+			if loading_bar is not None:
+				loading_bar.close()
+		return written
+	
+	def get_stream_stats(self, path: str, confidence: float = 0.95) -> dict:
+		"""
+		`self.get_stats` of the journeys written by `self.stream_journeys`, reading only the
+		times & status of the file.
+		:param path: The file written by `self.stream_journeys` with a disruption applied
+		:param confidence: Confidence level of `score_ci`
+		"""
+		columns = JourneyStream.read_columns(path)
+		stats = journey_stats(*columns)
+		stats['score_ci'] = score_interval(*columns, confidence=confidence, seed=self.seed)
+		return stats
+	
+	@contextmanager
+	def undisrupted(self):
+		"""
+		Temporarily lifts all disruptions from `self.net`, for routing undisrupted journeys
+		while a disruption is applied. Disruption results in `self.journeys` are kept.
+		"""
+		disruptions = self.disruptions
+		self.net.clear_disruptions()
+		self.disruptions = []
+		try:
+			yield
+		finally:
+			self.disruptions = disruptions
+			for disruption in disruptions:
+				if len(disruption) == 1:
+					self.net.disrupt_station(*disruption)
+				elif self.net.has_edge(*disruption[:2]):
+					self.net.disrupt_segment(*disruption)
+				else:
+					self.net.disrupt_stretch(*disruption)
 	
-		for _ in iterator:
-			origin, target = sample(list(self.net.nodes), k=2)
-			lines, time, stations = self.net.fastest_path(origin, target)
-			self.journeys.append({
-				'origin': origin,
-				'target': target,
-				'lines': lines,
-				'time': time,
-				'stations': stations
-			})
-			
 	def disrupt(self, station: str | list[str | set]) -> None:
 		"""
-		Simulates a disruption & adds the new trip details to the `self.journeys` dictionary.
+		Simulates a disruption & adds the new trip details to the `self.journeys` store.
 		:param station: Either a single string of the station name to be deleted from the
 			transit graph `self.net` with all adjacent edges are also deleted, or a list
 			containing the origin & target names of the desired segment to be deleted.
 			An optional 3rd element in the list can be a set containing only specific lines to
 			remove from the segment. If this is left empty, the entire segment is removed.
+			If the stations are not adjacent, the lines are removed along the whole stretch
+			between them, such as `['Längenfeldgasse', 'Westbahnhof', {'U6'}]`. Left empty,
+			all lines connecting them without a break are removed, see
+			`TransitGraph.disrupt_stretch`.
 		"""
 		
 		if self.disruption_ran:
@@ -113,15 +354,18 @@ class Simulator:
 		"""
 		Called by `self.disrupt()`. Relevant docs are there.
 		"""
-		if not self.net.has_node(station_to_close):
+		if not self.net.has_station(station_to_close):
 			if station_to_close in self.removed_stations:
 				print('Station already removed.')
 			else:
-				find_possible_match(station_to_close, list(self.net.nodes))
+				find_possible_match(
+					station_to_close, self.net.stations(), index=self.net.station_index()
+				)
 			return
 		
-		self.net.remove_node(station_to_close)
+		self.net.disrupt_station(station_to_close)
 		self.removed_stations.append(station_to_close)
+		self.disruptions.append([station_to_close])
 		self.disruption = True
 	
 	def disrupt_segment(self, origin, target, certain_lines: set = None) -> None:
@@ -131,112 +375,338 @@ class Simulator:
 		
 		not_found_flag = False
 		for station in [origin, target]:
-			if not self.net.has_node(station):
+			if not self.net.has_station(station):
 				if station in self.removed_stations:
 					print(f'Station {station} already removed, thus also this segment.')
 					return
 				else:
-					find_possible_match(station, list(self.net.nodes))
+					find_possible_match(station, self.net.stations(), index=self.net.station_index())
 					not_found_flag = True
 
 		if not_found_flag:
 			return
 		
 		if not self.net.has_edge(origin, target):
-			print(f'Origin `{origin}` & Target `{target}` are not adjacent to eachother.')
+			self.disrupt_stretch(origin, target, certain_lines)
+			return
+		
+		if not self.net.has_segment(origin, target):
+			print(f'Segment `{origin}` - `{target}` already removed.')
 			return
 			
+		self.net.disrupt_segment(origin, target, certain_lines)
+		
+		self.removed_segments.append(frozenset([origin, target]))
+		self.disruptions.append([origin, target, certain_lines])
+		self.disruption = True
+	
+	def disrupt_stretch(self, origin: str, target: str, certain_lines: set = None) -> None:
+		"""
+		Called by `self.disrupt_segment()` for stations that are not adjacent. Relevant docs
+		are in `self.disrupt()`.
+		"""
+		connecting = self.net.lines_between(origin, target)
+		if not connecting:
+			print(f'Error: No line connects `{origin}` & `{target}` without a break.')
+			return
+		
 		if certain_lines is None:
-			self.net.remove_edge(origin, target)
-		else:
-			for line in certain_lines:
-				self.net[origin][target]['lines'].remove(line)
+			certain_lines = set(connecting)
+		elif not set(certain_lines) <= set(connecting):
+			print(
+				f'Error: Lines {set(certain_lines) - set(connecting)} do not connect `{origin}` & '
+				f'`{target}` without a break. The connecting lines are {connecting}.'
+			)
+			return
 		
+		self.net.disrupt_stretch(origin, target, certain_lines)
+		
+		segments = set()
+		for line in certain_lines:
+			segments.update(self.net.line_index().segments(line, origin, target))
+		self.removed_segments.extend(segments)
+		self.disruptions.append([origin, target, set(certain_lines)])
 		self.disruption = True
+	
+	def index_journeys(self, start: int = 0) -> None:
+		"""
+		Indexes the simulated journeys by every station & segment they pass through, so that
+		`self.affected_journeys` can find the journeys crossing a disruption.
+		:param start: Only add the journeys from this index onwards to the existing index.
+		"""
+		if self.metrics.enabled:
+			start_time = perf_counter()
+		if start == 0:
+			self.station_journeys = {}
+			self.segment_journeys = {}
+		for index in range(start, len(self.journeys)):
+			stations = self.journeys.station_ids_of(index)
+			for station in stations:
+				self.station_journeys.setdefault(station, []).append(index)
+			for station1, station2 in zip(stations, stations[1:]):
+				segment = (station1, station2) if station1 < station2 else (station2, station1)
+				self.segment_journeys.setdefault(segment, []).append(index)
+		if self.metrics.enabled:
+			self.metrics.since('index_journeys', start_time)
+	
+	def disrupted_elements(self) -> tuple[set[str], set[tuple[str, str]]]:
+		"""
+		The removed stations & segments by name, with each segment as a sorted pair. Stations
+		no journey has visited yet are included, since journeys rerouted around another
+		disruption can still pass through them.
+		"""
+		stations = set(self.removed_stations)
+		segments = {tuple(sorted(segment)) for segment in self.removed_segments}
+		return stations, segments
+	
+	def journey_elements(self,
+		indices: list[int],
+		new: bool = False
+	) -> tuple[set[int], set[tuple[int, int]]]:
+		"""
+		Collects the stations & segments passed through by some journeys.
+		:param indices: The indices of the journeys in `self.journeys`
+		:param new: Use the journeys after the disruption instead
+		:return: The station ids & the segments as sorted pairs of station ids.
+		"""
+		stations = set()
+		segments = set()
+		for index in indices:
+			path = self.journeys.station_ids_of(index, new)
+			stations.update(path)
+			segments.update(
+				(station1, station2) if station1 < station2 else (station2, station1)
+				for station1, station2 in zip(path, path[1:])
+			)
+		return stations, segments
+	
+	def worker_pool(self, disruptions: list[list]) -> Pool:
+		"""
+		A process pool of `self.workers`, each loading the graph once with some disruptions
+		applied, see `_init_worker`.
+		:param disruptions: Disruptions in the format of `self.disruptions`
+		"""
+		return Pool(
+			self.workers,
+			initializer=_init_worker,
+			initargs=(self.paths_before_transfers, self.routing, self.route_table, disruptions)
+		)
+	
+	def route_journeys(self,
+		pairs: list[tuple[str, str]],
+		description: str | None,
+		method: str = None,
+		pool: Pool = None
+	) -> list[tuple | Exception]:
+		"""
+		Routes origin & target pairs on the current graph. The pairs are grouped by origin, so
+		all targets of an origin are answered by a single search where the routing method
+		supports it, see `TransitGraph.fastest_paths_from`. With more than 1 of `self.workers`
+		the origins are split across a process pool, while the results keep the order of `pairs`.
+		:param pairs: The origin & target of each journey
+		:param description: The description of the tqdm loading bar, or None to hide the bar
+		:param method: see `TransitGraph.fastest_path()` for docs
+		:param pool: A pool of `self.worker_pool` to route on, which is kept open for later
+			calls. Otherwise a pool is created for this call only.
+		:return: For each pair, either the result of `TransitGraph.fastest_path` or the
+			networkx exception raised when the journey is not possible.
+		"""
+		origins: dict[str, list[int]] = {}
+		for index, (origin, _) in enumerate(pairs):
+			origins.setdefault(origin, []).append(index)
+		groups = [
+			(origin, [pairs[index][1] for index in indices], method)
+			for origin, indices in origins.items()
+		]
+		
+		own_pool = None
+		if self.workers > 1 and len(groups) > 1:
+			if pool is None:
+				pool = own_pool = self.worker_pool(self.disruptions)
+			# several chunks per worker, so the loading bar keeps moving
+			group_results = pool.imap(
+				_route_from_in_worker, groups, chunksize=max(1, len(groups) // (self.workers * 16))
+			)
+		else:
+			group_results = (_route_from(self.net, *group) for group in groups)
 		
-	def simulate_disruption(self, print_unreachable: bool = False) -> None:
+		results = [None] * len(pairs)
+		loading_bar = tqdm(total=len(pairs), desc=description) \
+			if self.loading_bars and description is not None else None
+		try:
+			for indices, origin_results in zip(origins.values(), group_results):
+				for index, result in zip(indices, origin_results):
+					results[index] = result
+				if loading_bar is not None:
+					loading_bar.update(len(indices))
+		finally:
+			if own_pool is not None:
+				own_pool.terminate()
+			if loading_bar is not None:
+				loading_bar.close()
+		return results
+	
+	def affected_journeys(self) -> list[int]:
+		"""
+		Finds the journeys whose undisrupted path crosses any removed station or segment. A
+		segment with only certain lines removed counts as a whole, since the wait times of the
+		remaining lines change as well.
+		:return: The sorted indices of the affected journeys in `self.journeys`.
+		"""
+		if self.station_journeys is None:
+			self.index_journeys()
+		
+		station_ids = self.journeys.station_ids
+		affected = set()
+		for station in self.removed_stations:
+			affected.update(self.station_journeys.get(station_ids.get(station), []))
+		for segment in self.removed_segments:
+			if all(station in station_ids for station in segment):
+				segment = tuple(sorted(station_ids[station] for station in segment))
+				affected.update(self.segment_journeys.get(segment, []))
+		return sorted(affected)
+		
+	def simulate_disruption(self, print_unreachable: bool = False, incremental: bool = None) -> None:
 		"""
 		To re-run all journeys after a `self.disrupt()`
 		:param print_unreachable: Print out the origin & target of journeys that are no longer
 			possible due to the disruption.
+		:param incremental: Only re-run the journeys crossing a disrupted station or segment,
+			see `self.affected_journeys`. All other journeys keep their undisrupted result,
+			which is exact for the routing methods of `TG.exact_routing_methods`. With
+			`heuristic` routing, a disruption can push new candidate paths into the top
+			`paths_before_transfers` & make journeys faster, which this skips. Left empty, it
+			is only used for the exact routing methods.
 		"""
 		
 		if not self.disruption:
 			print('Error: Disrupt a station/segment before simulating it.')
 			return
 		
-		iterator = tqdm(self.journeys, desc='Simulating disruption') \
-			if self.loading_bars \
-			else self.journeys
+		if self.metrics.enabled:
+			start = perf_counter()
+		self.journeys.clear_new()
+		self.reroute_journeys(range(len(self.journeys)), print_unreachable, incremental)
+		self.disruption_ran = True
+		if self.metrics.enabled:
+			self.metrics.since('simulate_disruption', start)
+	
+	def _incremental(self, incremental: bool | None) -> bool:
+		"""
+		Resolves the `incremental` argument of `self.simulate_disruption`, which is left empty
+		by default.
+		"""
+		if incremental is None:
+			return self.routing in TG.exact_routing_methods
+		return incremental
+	
+	def reroute_journeys(self,
+		indices: range,
+		print_unreachable: bool = False,
+		incremental: bool = None
+	) -> None:
+		"""
+		Routes some journeys with the current disruption, see `self.simulate_disruption` for docs.
+		:param indices: The consecutive indices of the journeys in `self.journeys`
+		"""
+		if self._incremental(incremental):
+			self.journeys.keep_undisrupted(indices)
+			indices = [index for index in self.affected_journeys() if index in indices]
 		
-		for journey in iterator:
-			try:
-				lines, time, stations = self.net.fastest_path(
-					journey['origin'], journey['target'], sim_mode=True
-				)
-				journey['lines_new'] = lines
-				journey['time_new'] = time
-				journey['stations_new'] = stations
-			except nx.exception.NodeNotFound:
-				if print_unreachable:
-					print(
-						f'Journey from {journey["origin"]} to {journey["target"]} not possible'
+		stations = self.journeys.stations
+		pairs = [
+			(stations[self.journeys.origins[index]], stations[self.journeys.targets[index]])
+			for index in indices
+		]
+		results = self.route_journeys(pairs, 'Simulating disruption')
+		if self.metrics.enabled:
+			self.metrics.count('journeys_rerouted', len(pairs))
+		
+		for index, (origin, target), result in zip(indices, pairs, results):
+			if isinstance(result, Exception):
+				if self.metrics.enabled:
+					self.metrics.count(
+						'canceled_node_not_found' if isinstance(result, nx.exception.NodeNotFound)
+						else 'canceled_no_path'
 					)
-				continue
-			except nx.exception.NetworkXNoPath:
+				self.journeys.cancel(index)
 				if print_unreachable:
-					print(
-						f'Journey from {journey["origin"]} to {journey["target"]} '
-						f'is no longer reachable'
-					)
+					if isinstance(result, nx.exception.NodeNotFound):
+						print(f'Journey from {origin} to {target} not possible')
+					else:
+						print(f'Journey from {origin} to {target} is no longer reachable')
 				continue
+			
+			self.journeys.set_new(index, *result)
+	
+	def simulate_adaptive(self,
+		batch_size: int = 500,
+		target_width: float = 0.2,
+		confidence: float = 0.95,
+		max_journeys: int = 20_000,
+		incremental: bool = None
+	) -> dict:
+		"""
+		Sequential sampling of a disruption. After simulating the disruption on the current
+		journeys, batches of new journeys are added until the confidence interval of the score
+		is narrow enough. The 1st batch is the `self.journey_count` journeys simulated by
+		`self.disrupt()`, so set this to the minimum # of journeys to trust.
+		:param batch_size: # of journeys to add per batch
+		:param target_width: Stop once the width of the interval is at most this fraction of
+			the score. Since the score grows with the # of journeys, the width is relative.
+		:param confidence: Confidence level of the interval, see `score_interval`
+		:param max_journeys: Stop at this # of journeys even if the interval is still wide
+		:param incremental: see `self.simulate_disruption()` for docs
+		:return: The statistics of `self.get_stats()` at the final # of journeys.
+		"""
+		if not self.disruption_ran:
+			self.simulate_disruption(incremental=incremental)
+		if not self.disruption_ran:
+			return dict()
 		
-		self.disruption_ran = True
+		while True:
+			stats = self.get_stats(confidence)
+			low, high = stats['score_ci']
+			if high - low <= target_width * abs(stats['score']) or len(self.journeys) >= max_journeys:
+				return stats
+			
+			indices = self.add_journeys(min(batch_size, max_journeys - len(self.journeys)))
+			self.reroute_journeys(indices, incremental=incremental)
 		
-	def get_stats(self) -> dict:
+	def get_stats(self, confidence: float = 0.95) -> dict:
 		"""
-		Calculates various statistics after simulating a disruption.
+		Calculates various statistics after simulating a disruption, see `journey_stats`. The
+		key `score_ci` holds the bootstrap confidence interval of the score, see `score_interval`.
+		:param confidence: Confidence level of `score_ci`
 		"""
 		if not self.disruption_ran:
 			print('Error: No simulation of disruption was found')
 			return dict()
 		
-		canceled = 0
-		faster = 0
-		delayed = 0
-		delays = []
-		delays_percent = []
-		for index, journey in enumerate(self.journeys):
-			if 'time_new' in journey:
-				if journey['time_new'] != journey['time']:
-					if journey['time_new'] < journey['time']:
-						faster += 1
-					else:
-						delayed += 1
-					delays.append(journey['time_new'] - journey['time'])
-					delays_percent.append((journey['time_new']*100) / journey['time'] - 100)
-			else:
-				canceled += 1
-
-		return {
-			'score': canceled * 100 + delayed * np.mean(delays_percent),
-			'journeys_delayed': delayed,
-			'journeys_faster': faster,
-			'journeys_canceled': canceled,
-			'journeys_total': self.journey_count,
-			'delay_times': {
-				'min': min(delays),
-				'median': np.median(delays),
-				'mean': np.mean(delays),
-				'max': max(delays),
-			},
-			'delay_times_perc': {
-				'min': min(delays_percent),
-				'median': np.median(delays_percent),
-				'mean': np.mean(delays_percent),
-				'max': max(delays_percent),
-			}
-		}
+		columns = self.journeys.times, self.journeys.times_new, self.journeys.status
+		stats = journey_stats(*columns)
+		stats['score_ci'] = score_interval(*columns, confidence=confidence, seed=self.seed)
+		return stats
+	
+	def get_metrics(self) -> dict:
+		"""
+		The metrics collected while `metrics` is enabled, see `Metrics.snapshot` for the format.
+		:return: A dictionary of the following keys:
+			
+			* simulator : Time per phase & journey counts of this simulator.
+			
+			*
+				graph : Routing queries, timers per routing phase, counts of impossible
+				journeys & cache hit rates of `self.net`.
+		"""
+		return {'simulator': self.metrics.snapshot(), 'graph': self.net.metrics.snapshot()}
+	
+	def reset_metrics(self) -> None:
+		"""
+		Removes all collected metrics of the simulator & its graph.
+		"""
+		self.metrics.reset()
+		self.net.metrics.reset()
 	
 	def plot_delay(self, affected_only: bool = True) -> None:
 		"""
@@ -247,21 +717,153 @@ class Simulator:
 			print('Error: No disruption was found')
 			return
 		
-		time_old, time_new = [], []
-		
-		for journey in self.journeys:
-			if affected_only:
-				if 'time_new' in journey and journey['time'] != journey['time_new']:
-					time_old.append(journey['time'])
-					time_new.append(journey['time_new'])
-			else:
-				if 'time_new' in journey:
-					time_old.append(journey['time'])
-					time_new.append(journey['time_new'])
+		shown = self.journeys.status == ROUTED
+		if affected_only:
+			shown &= self.journeys.times != self.journeys.times_new
+		time_old = self.journeys.times[shown]
+		time_new = self.journeys.times_new[shown]
 
 		plt.hist(time_old, bins=25, alpha=.5, label='old')
 		plt.hist(time_new, bins=25, alpha=.5, label='new')
 		plt.legend(loc='upper right')
 		plt.show()
-		
-		
\ No newline at end of file
+
+
+def journey_stats(time: np.ndarray, time_new: np.ndarray, status: np.ndarray) -> dict:
+	"""
+	Calculates the statistics of `Simulator.get_stats` from the columns of a `JourneyStore`.
+	:param time: The undisrupted journey times
+	:param time_new: The journey times after the disruption
+	:param status: The status of each journey after the disruption
+	"""
+	routed = status == ROUTED
+	changed = routed & (time_new != time)
+	
+	canceled = int(np.count_nonzero(status == CANCELED))
+	faster = int(np.count_nonzero(changed & (time_new < time)))
+	delayed = int(np.count_nonzero(changed & (time_new > time)))
+	delays = time_new[changed] - time[changed]
+	delays_percent = (time_new[changed] * 100) / time[changed] - 100
+	
+	def summary(values: np.ndarray) -> dict:
+		if values.size == 0:
+			return {'min': np.nan, 'median': np.nan, 'mean': np.nan, 'max': np.nan}
+		return {
+			'min': values.min(),
+			'median': np.median(values),
+			'mean': values.mean(),
+			'max': values.max(),
+		}
+	
+	return {
+		'score': canceled * 100 + (delayed * delays_percent.mean() if delayed else 0),
+		'journeys_delayed': delayed,
+		'journeys_faster': faster,
+		'journeys_canceled': canceled,
+		'journeys_total': len(time),
+		'delay_times': summary(delays),
+		'delay_times_perc': summary(delays_percent)
+	}
+
+
+def score_interval(
+	time: np.ndarray,
+	time_new: np.ndarray,
+	status: np.ndarray,
+	confidence: float = 0.95,
+	resamples: int = 1_000,
+	seed: int = None
+) -> tuple[float, float]:
+	"""
+	Poisson bootstrap confidence interval of the score of `journey_stats`. Each journey is
+	weighted by a Poisson(1) count in every resample, so only canceled & changed journeys,
+	the only ones adding to the score, need to be drawn.
+	:param time: The undisrupted journey times
+	:param time_new: The journey times after the disruption
+	:param status: The status of each journey after the disruption
+	:param confidence: Confidence level of the percentile interval
+	:param resamples: # of bootstrap resamples
+	:param seed: Seed of the resampling
+	:return: The lower & upper bound of the score.
+	"""
+	changed = (status == ROUTED) & (time_new != time)
+	canceled = status == CANCELED
+	relevant = changed | canceled
+	if not relevant.any():
+		return 0.0, 0.0
+	
+	changed = changed[relevant]
+	delayed = changed & (time_new[relevant] > time[relevant])
+	delays_percent = np.zeros(changed.size)
+	delays_percent[changed] = (time_new[relevant][changed] * 100) / time[relevant][changed] - 100
+	
+	weights = np.random.default_rng(seed).poisson(1.0, size=(resamples, changed.size))
+	canceled_counts = weights @ canceled[relevant]
+	delayed_counts = weights @ delayed
+	changed_counts = weights @ changed
+	scores = canceled_counts * 100 + np.where(
+		delayed_counts > 0,
+		delayed_counts * (weights @ delays_percent) / np.maximum(changed_counts, 1),
+		0
+	)
+	low, high = np.quantile(scores, [(1 - confidence) / 2, (1 + confidence) / 2])
+	return float(low), float(high)
+
+
+def _route_from(
+	net: TG,
+	origin: str,
+	targets: list[str],
+	method: str = None
+) -> list[tuple | Exception]:
+	"""
+	Routes the journeys of a single origin for `Simulator.route_journeys`, returning the
+	networkx exception instead of raising it when a journey is not possible.
+	"""
+	try:
+		journeys = net.fastest_paths_from(origin, targets, method)
+	except nx.exception.NodeNotFound as exception:
+		return [exception] * len(targets)
+	
+	results = []
+	for target in targets:
+		if target in journeys:
+			results.append(journeys[target])
+		elif not net.has_station(target):
+			results.append(nx.exception.NodeNotFound(f'Station {target} is not in the graph'))
+		else:
+			results.append(nx.exception.NetworkXNoPath(f'No path between {origin} and {target}.'))
+	return results
+
+
+# graph of a worker process, set by `_init_worker`
+_worker_net: TG | None = None
+
+
+def _init_worker(
+	paths_before_transfers: int,
+	routing: str,
+	route_table: str | None,
+	disruptions: list[list]
+) -> None:
+	"""
+	Loads the graph of a worker process once & applies the disruptions of the parent simulator.
+	"""
+	global _worker_net
+	sim = Simulator(
+		0, paths_before_transfers, loading_bars=False, routing=routing, route_table=route_table
+	)
+	for disruption in disruptions:
+		if len(disruption) == 1:
+			sim.disrupt_station(*disruption)
+		else:
+			sim.disrupt_segment(*disruption)
+	_worker_net = sim.net
+
+
+def _route_from_in_worker(group: tuple[str, list[str], str | None]) -> list[tuple | Exception]:
+	"""
+	Routes the (origin, targets, method) journeys of a single origin on the graph of a worker
+	process.
+	"""
+	return _route_from(_worker_net, *group)
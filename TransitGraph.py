@@ -1,8 +1,19 @@
+import numpy as np
 import networkx as nx
 from os import listdir
 from re import match
-from copy import deepcopy
-from FuzzyFunctions import find_possible_match
+from heapq import heappush, heappop
+from itertools import count
+from hashlib import sha256
+from time import perf_counter
+from FuzzyFunctions import find_possible_match, StationIndex
+from RouteTable import RouteTable
+from CompactGraph import CompactGraph
+from RaptorRouter import RaptorRouter
+from LineIndex import LineIndex
+from LineRegistry import LineRegistry
+from Metrics import Metrics
+import GraphCache
 
 
 class TransitGraph(nx.Graph):
@@ -34,7 +45,50 @@ class TransitGraph(nx.Graph):
 		'S45': 10
 	}
 	
-	def __init__(self, paths_before_transfers: int = 10, verbose_loading: bool = False):
+	'''
+	Routing methods supported by `self.fastest_path`:
+	
+	* heuristic : Enumerates `self.paths_before_transfers` paths by travel time only & scores
+		the transfers afterwards. This is the original method of the project.
+	* line_expanded : A single Dijkstra run over (station, lines) states, with the transfer
+		& wait times on the edges. This always returns the fastest journey.
+	* table : A lookup in the route table loaded by `self.load_route_table`, which holds the
+		`line_expanded` journeys of the undisrupted network. While disrupted, this falls back
+		to `line_expanded`.
+	* csr : The `line_expanded` search run on the integer arrays of `self.compact_graph`.
+	* astar : The `line_expanded` search directed towards the target by the lower bounds of
+		`self.landmark_bounds`. This finds journeys of the same time while settling far fewer
+		states, which suits single queries.
+	* raptor : The fastest of the journeys found by `self.raptor_router`, which scans whole
+		lines round by round instead of using a priority queue. The same router finds the
+		fastest journey for every # of transfers, see `self.pareto_journeys`.
+	'''
+	routing_methods = ['heuristic', 'line_expanded', 'table', 'csr', 'astar', 'raptor']
+	
+	'''
+	Routing methods that always return the fastest journey. A disruption then only changes the
+	journeys passing through it, which lets the simulator skip re-routing all others.
+	'''
+	exact_routing_methods = ['line_expanded', 'table', 'csr', 'astar', 'raptor']
+	
+	'''
+	# of landmark stations used for the lower bounds of `astar` routing.
+	'''
+	landmark_count = 8
+	
+	'''
+	# of targets from which `self.fastest_paths_from` answers an `astar` origin with a single
+	`line_expanded` search. Below this, routing each target on its own settles fewer states.
+	'''
+	astar_group_targets = 8
+	
+	def __init__(self,
+		paths_before_transfers: int = 10,
+		verbose_loading: bool = False,
+		routing: str = 'heuristic',
+		graph_cache: str | None = GraphCache.DEFAULT_PATH,
+		line_folder: str = 'lines'
+	):
 		"""
 		An extension of the networkx `Graph` class, with some extra methods that pertain to a
 		transit network. All lines are assumed to be fully bidirectional, meaning no one-way
@@ -44,12 +98,63 @@ class TransitGraph(nx.Graph):
 			waiting for lower frequency lines. The fastest line among the initial paths is
 			returned after this is calculated
 		:param verbose_loading: Print out line conflict types when loading default graph.
+		:param routing: The default routing method of `self.fastest_path`, one of
+			`self.routing_methods`.
+		:param graph_cache: Path of the compiled graph cache, see `self.load_default_graph`. By
+			default it is kept next to the line folder, see `GraphCache.cache_path`. Set to None
+			to always load the line files.
+		:param line_folder: The folder of line files to load, see `self.load_default_graph`.
+			Lines can also be added afterwards with `self.add_lines`, in which case the graph
+			cache should be disabled.
 		"""
 		super().__init__()
-		self.load_default_graph(verbose=verbose_loading)
+		assert routing in self.routing_methods, f'Routing must be one of {self.routing_methods}'
+		
+		# counters & timers of the routing, disabled by default, see `self.fastest_path`
+		self.metrics = Metrics()
+		# line name -> line type, filled by `self.add_lines`
+		self.line_types: dict[str, str] = {}
+		# line name -> stations of the line in order, filled by `self.add_lines`
+		self.line_stations: dict[str, list[str]] = {}
+		# integer ids & bitmasks of the lines, used by the heuristic routing
+		self.line_registry = LineRegistry(self.metrics)
+		# caches for the line expanded search, keyed by the lines of an edge
+		self._type_groups: dict[frozenset, tuple] = {}
+		self._wait_cache: dict[frozenset, float] = {}
+		# set by `self.load_route_table`
+		self.route_table = None
+		# built on demand by `self.compact_graph`, along with its translated overlay
+		self._compact: CompactGraph | None = None
+		self._compact_overlay: tuple | None = None
+		# built on demand by `self.station_index`
+		self._station_index: StationIndex | None = None
+		# built on demand by `self.line_index`
+		self._line_index: LineIndex | None = None
+		# built on demand by `self.landmark_bounds`
+		self._landmarks: tuple[dict[str, int], np.ndarray] | None = None
+		# built on demand by `self.raptor_router`, along with its translated overlay
+		self._raptor: RaptorRouter | None = None
+		self._raptor_overlay: tuple | None = None
+		
+		'''
+		Disruption overlay. The loaded graph itself is never changed by a disruption, instead
+		the removed elements are recorded here & skipped by every routing method. Each entry
+		in `self.disruption_log` holds what a single disruption removed, so it can be undone.
+		'''
+		self.removed_stations: set[str] = set()
+		self.removed_segments: set[frozenset] = set()
+		self.removed_lines: dict[frozenset, set[str]] = {}
+		self.disruption_log: list[tuple] = []
+		
+		self.load_default_graph(line_folder, verbose_loading, graph_cache)
 		self.paths_before_transfers = paths_before_transfers
+		self.routing = routing
 	
-	def load_default_graph(self, line_folder: str = 'lines', verbose: bool = False) -> None:
+	def load_default_graph(self,
+		line_folder: str = 'lines',
+		verbose: bool = False,
+		graph_cache: str = None
+	) -> None:
 		"""
 		Populates the graph. Each line needs a file in the following format:
 		
@@ -61,9 +166,27 @@ class TransitGraph(nx.Graph):
 		
 		:param line_folder: Name of the folder containing the line files. No subfolders or extra
 			files are allowed.
-		:param verbose: Print out line conflict types when loading default graph.
+		:param verbose: Print out line conflict types when loading default graph. This always
+			loads the line files.
+		:param graph_cache: Path of a cache written by `GraphCache.write_graph_cache`, where
+			`{line_folder}` is replaced by the line folder. If it matches the hash of the line
+			folder, the graph is loaded from it instead. Otherwise the line files are loaded &
+			the cache is rewritten.
 		"""
 		
+		self.line_folder = line_folder
+		self.network_hash = self.hash_line_folder(line_folder)
+		if graph_cache is not None:
+			graph_cache = GraphCache.cache_path(graph_cache, line_folder)
+		
+		if graph_cache is not None and not verbose:
+			try:
+				self.load_graph_cache(*GraphCache.read_graph_cache(graph_cache, self.network_hash))
+				return
+			except (OSError, ValueError):
+				# missing or stale, rebuilt below
+				pass
+		
 		for file_name in listdir(line_folder):
 			line_name = file_name.split('.')[0]
 			stations = []
@@ -73,6 +196,70 @@ class TransitGraph(nx.Graph):
 					stations.append(line.strip())
 			self.add_lines(line_name, stations, verbose=verbose)
 		
+		if graph_cache is not None:
+			try:
+				GraphCache.write_graph_cache(self, graph_cache)
+			except OSError:
+				# the graph is loaded either way, only the next start is slower
+				pass
+	
+	def load_graph_cache(self, header: dict, arrays: dict[str, np.ndarray]) -> None:
+		"""
+		Populates the graph from the contents of a graph cache, see `GraphCache.read_graph_cache`.
+		The result is identical to loading the line files with `self.add_lines`.
+		"""
+		for line_name, line_type in zip(header['lines'], header['line_types']):
+			self.line_types[line_name] = line_type
+			self.line_registry.add(line_name, line_type, self.line_wait_time(line_name))
+		self._compact = None
+		self._station_index = None
+		self._line_index = None
+		self._landmarks = None
+		self._raptor = None
+		
+		stations = header['stations']
+		types = header['types']
+		line_offsets = arrays['edge_line_offsets'].tolist()
+		line_ids = arrays['edge_line_ids'].tolist()
+		self.add_nodes_from(stations)
+		
+		station_offsets = arrays['line_station_offsets'].tolist()
+		station_ids = arrays['line_station_ids'].tolist()
+		for index, line_name in enumerate(header['lines']):
+			self.line_stations[line_name] = [
+				stations[station_id] for station_id in station_ids[station_offsets[index]:station_offsets[index + 1]]
+			]
+		
+		for index, (station1, station2, type_index) in enumerate(zip(
+			arrays['edge_sources'].tolist(), arrays['edge_targets'].tolist(), arrays['edge_types'].tolist()
+		)):
+			segment_line_ids = line_ids[line_offsets[index]:line_offsets[index + 1]]
+			self.add_edge(
+				stations[station1],
+				stations[station2],
+				lines={self.line_registry.names[line_id] for line_id in segment_line_ids},
+				line_mask=sum(1 << line_id for line_id in segment_line_ids),
+				type=types[type_index],
+				travel_time=self.travel_times[types[type_index]],
+			)
+		
+	def hash_line_folder(self, line_folder: str = 'lines') -> str:
+		"""
+		Hashes the contents of a line folder along with the travel & wait time tables. Any files
+		derived from the network, such as a route table, are keyed by this hash.
+		:param line_folder: Name of the folder containing the line files.
+		:return: The hexadecimal sha256 digest.
+		"""
+		digest = sha256()
+		for table in [self.travel_times, self.wait_times, self.wait_times_exceptions]:
+			digest.update(repr(sorted(table.items())).encode())
+		
+		for file_name in sorted(listdir(line_folder)):
+			digest.update(file_name.encode())
+			with open(f'{line_folder}/{file_name}', 'rb') as file:
+				digest.update(sha256(file.read()).digest())
+		return digest.hexdigest()
+	
 	def add_lines(self,
 		line_name: str,
 		stations: list[str],
@@ -91,6 +278,8 @@ class TransitGraph(nx.Graph):
 			
 		* travel_time : The shortest travel time of all lines that service the segment.
 		
+		* line_mask : The lines as a bitmask of `self.line_registry`.
+		
 		:param line_name: The name of the line as a string
 		:param stations: The 2 stations connected by this line
 		:param custom_type: A manually specified type of line that must be implemented in
@@ -102,12 +291,21 @@ class TransitGraph(nx.Graph):
 			line_type = self.detect_line_type(line_name)
 		else:
 			line_type = custom_type
+		self.line_types[line_name] = line_type
+		self.line_stations[line_name] = list(stations)
+		line_bit = 1 << self.line_registry.add(line_name, line_type, self.line_wait_time(line_name))
+		self._compact = None
+		self._station_index = None
+		self._line_index = None
+		self._landmarks = None
+		self._raptor = None
 	
 		for index, station1 in enumerate(stations[:-1]):
 			station2 = stations[index + 1]
 			
 			if self.has_edge(station1, station2):
 				self[station1][station2]['lines'].add(line_name)
+				self[station1][station2]['line_mask'] |= line_bit
 				'''
 				If the line is of a different type than the existing value, convert it to the
 				type with the shortest travel time. This is based on the assumption that longer
@@ -136,6 +334,7 @@ class TransitGraph(nx.Graph):
 					station2,
 					# encapsulate in a set in case of shared lines to remove possible duplicates
 					lines={line_name},
+					line_mask=line_bit,
 					type=line_type,
 					travel_time=self.travel_times[line_type],
 				)
@@ -166,6 +365,236 @@ class TransitGraph(nx.Graph):
 			raise ValueError(f'Could not automatically determine type of {line_name}')
 		return line_type
 	
+	def has_station(self, station: str) -> bool:
+		"""
+		Whether a station exists & is not removed by a disruption.
+		"""
+		return self.has_node(station) and station not in self.removed_stations
+	
+	def has_segment(self, station1: str, station2: str) -> bool:
+		"""
+		Whether a segment exists & still has any lines serving it after all disruptions.
+		"""
+		return self.has_edge(station1, station2) and len(self.segment_lines(station1, station2)) > 0
+	
+	def stations(self) -> list[str]:
+		"""
+		All stations not removed by a disruption.
+		"""
+		return [station for station in self.nodes if station not in self.removed_stations]
+	
+	def segment_lines(self, station1: str, station2: str) -> set[str]:
+		"""
+		The lines serving an existing segment after all disruptions. The returned set must not
+		be modified, as it can be the set stored in the graph.
+		"""
+		lines = self[station1][station2]['lines']
+		if not self.disruption_log:
+			return lines
+		if station1 in self.removed_stations or station2 in self.removed_stations:
+			return set()
+		
+		segment = frozenset([station1, station2])
+		if segment in self.removed_segments:
+			return set()
+		if segment in self.removed_lines:
+			return lines - self.removed_lines[segment]
+		return lines
+	
+	def segment_mask(self, station1: str, station2: str) -> int:
+		"""
+		Same as `self.segment_lines`, but as a bitmask of `self.line_registry`.
+		"""
+		mask = self[station1][station2]['line_mask']
+		if not self.disruption_log:
+			return mask
+		if station1 in self.removed_stations or station2 in self.removed_stations:
+			return 0
+		
+		segment = frozenset([station1, station2])
+		if segment in self.removed_segments:
+			return 0
+		if segment in self.removed_lines:
+			return mask & ~self.line_registry.mask(self.removed_lines[segment])
+		return mask
+	
+	def disrupt_station(self, station: str) -> None:
+		"""
+		Removes a station along with all of its segments from routing.
+		:param station: The station to remove
+		:raise nx.NodeNotFound: If the station does not exist or is already removed.
+		"""
+		if not self.has_station(station):
+			raise nx.NodeNotFound(f'Station {station} is not in the graph')
+		self.removed_stations.add(station)
+		self.disruption_log.append(('station', station))
+		self._compact_overlay = None
+		self._raptor_overlay = None
+	
+	def disrupt_segment(self, station1: str, station2: str, lines: set[str] = None) -> None:
+		"""
+		Removes a segment from routing. Longer stretches of a line are removed with
+		`self.disrupt_stretch`.
+		:param station1: One end of the segment
+		:param station2: The other end of the segment
+		:param lines: Only remove these lines from the segment. If this is left empty, the
+			entire segment is removed.
+		:raise nx.NetworkXError: If the segment does not exist or is already removed.
+		:raise ValueError: If any of the lines does not serve the segment.
+		"""
+		if not self.has_edge(station1, station2) or not self.has_segment(station1, station2):
+			raise nx.NetworkXError(f'Segment {station1} - {station2} is not in the graph')
+		segment = frozenset([station1, station2])
+		
+		self._compact_overlay = None
+		self._raptor_overlay = None
+		if lines is None:
+			self.removed_segments.add(segment)
+			self.disruption_log.append(('segment', segment))
+			return
+		
+		missing = set(lines) - self.segment_lines(station1, station2)
+		if missing:
+			raise ValueError(f'Lines {missing} do not serve segment {station1} - {station2}')
+		self.removed_lines.setdefault(segment, set()).update(lines)
+		self.disruption_log.append(('lines', segment, set(lines)))
+	
+	def disrupt_stretch(self, station1: str, station2: str, lines: set[str] = None) -> None:
+		"""
+		Removes lines along the stretch between 2 stations, which do not have to be adjacent,
+		such as closing the U6 from Längenfeldgasse to Westbahnhof. Every segment of the
+		stretch loses these lines, while other lines on the same segments keep running. This
+		is undone by `self.revert_disruption` as a single disruption.
+		:param station1: One end of the stretch
+		:param station2: The other end of the stretch
+		:param lines: The lines to remove. If this is left empty, all lines connecting both
+			stations without a break are removed, see `self.lines_between`.
+		:raise nx.NodeNotFound: If either station does not exist or is removed.
+		:raise ValueError: If no line connects the stations, or any of the lines does not
+			connect them without a break.
+		"""
+		for station in [station1, station2]:
+			if not self.has_station(station):
+				raise nx.NodeNotFound(f'Station {station} is not in the graph')
+		connecting = self.lines_between(station1, station2)
+		if lines is None:
+			lines = connecting
+		if not lines:
+			raise ValueError(f'No line connects {station1} & {station2} without a break')
+		missing = set(lines) - set(connecting)
+		if missing:
+			raise ValueError(f'Lines {missing} do not connect {station1} & {station2} without a break')
+		
+		# every line is intact along the stretch, so none of them is removed from a segment twice
+		removed: dict[frozenset, set[str]] = {}
+		for line_name in lines:
+			for segment in self.line_index().segments(line_name, station1, station2):
+				removed.setdefault(segment, set()).add(line_name)
+		for segment, segment_lines in removed.items():
+			self.removed_lines.setdefault(segment, set()).update(segment_lines)
+		self.disruption_log.append(('stretch', removed))
+		self._compact_overlay = None
+		self._raptor_overlay = None
+	
+	def revert_disruption(self) -> None:
+		"""
+		Undoes the most recent disruption still in effect.
+		:raise IndexError: If there is no disruption to undo.
+		"""
+		kind, *removed = self.disruption_log.pop()
+		self._compact_overlay = None
+		self._raptor_overlay = None
+		if kind == 'station':
+			self.removed_stations.remove(removed[0])
+		elif kind == 'segment':
+			self.removed_segments.remove(removed[0])
+		elif kind == 'lines':
+			self._restore_lines(*removed)
+		else:
+			for segment, lines in removed[0].items():
+				self._restore_lines(segment, lines)
+	
+	def _restore_lines(self, segment: frozenset, lines: set[str]) -> None:
+		self.removed_lines[segment] -= lines
+		if not self.removed_lines[segment]:
+			del self.removed_lines[segment]
+	
+	def clear_disruptions(self) -> None:
+		"""
+		Undoes all disruptions.
+		"""
+		while self.disruption_log:
+			self.revert_disruption()
+	
+	def compact_graph(self) -> CompactGraph:
+		"""
+		The undisrupted network as a `CompactGraph`, built on first use.
+		"""
+		if self._compact is None:
+			self._compact = CompactGraph.from_graph(self)
+		return self._compact
+	
+	def raptor_router(self) -> RaptorRouter:
+		"""
+		The lines of the undisrupted network as a `RaptorRouter`, built on first use.
+		"""
+		if self._raptor is None:
+			self._raptor = RaptorRouter(self)
+		return self._raptor
+	
+	def station_index(self) -> StationIndex:
+		"""
+		The fuzzy lookup index over all station names, built on first use. Suggestions for
+		missing stations come from here, see `FuzzyFunctions.find_possible_match`.
+		"""
+		if self._station_index is None:
+			self._station_index = StationIndex(list(self.nodes))
+		return self._station_index
+	
+	def line_index(self) -> LineIndex:
+		"""
+		The position of every station on each line, built on first use.
+		"""
+		if self._line_index is None:
+			self._line_index = LineIndex(self.line_stations)
+		return self._line_index
+	
+	def lines_between(self, station1: str, station2: str) -> list[str]:
+		"""
+		The lines connecting 2 stations without a break, meaning every segment & station of
+		the line between them is still in service after all disruptions. This only walks the
+		stretches of the lines serving both stations, see `LineIndex`.
+		:return: The sorted line names, empty if either station is missing or removed.
+		"""
+		if not self.has_station(station1) or not self.has_station(station2):
+			return []
+		lines = self.line_index().lines_between(station1, station2)
+		if not self.disruption_log:
+			return lines
+		
+		connecting = []
+		for line_name in lines:
+			stretch = self.line_index().stretch(line_name, station1, station2)
+			if all(
+				line_name in self.segment_lines(start, end)
+				for start, end in zip(stretch, stretch[1:])
+			):
+				connecting.append(line_name)
+		return connecting
+	
+	def routing_view(self) -> nx.Graph:
+		"""
+		The graph as seen by networkx algorithms, which hides all removed stations & segments.
+		The lines of a segment should still be read through `self.segment_lines`.
+		"""
+		if not self.disruption_log:
+			return self
+		return nx.subgraph_view(
+			self,
+			filter_node=lambda station: station not in self.removed_stations,
+			filter_edge=lambda station1, station2: len(self.segment_lines(station1, station2)) > 0
+		)
+	
 	def fastest_paths(self,
 		source: str,
 		target: str,
@@ -174,7 +603,13 @@ class TransitGraph(nx.Graph):
 		Internal helper function called by `self.fastest_path`, see there for docs
 		"""
 		
-		path_generator = nx.shortest_simple_paths(self, source, target, weight='travel_time')
+		metrics = self.metrics
+		if metrics.enabled:
+			start = perf_counter()
+		
+		path_generator = nx.shortest_simple_paths(
+			self.routing_view(), source, target, weight='travel_time'
+		)
 		
 		# get a certain amount of journeys using only travel_time weights
 		top_paths: list[list[str]] = []
@@ -183,36 +618,42 @@ class TransitGraph(nx.Graph):
 				break
 			top_paths.append(path)
 		
+		if metrics.enabled:
+			start = metrics.since('path_enumeration', start)
+			metrics.count('paths_enumerated', len(top_paths))
+		
 		# calculate transfer times & also get a list of possible lines throughout the route
+		registry = self.line_registry
 		total_times = []  # same length as `top_paths`
 		lines_in_paths = []  # lines used in each candidate journey
 		for candidate_path in top_paths:
-			lines_possible: list[set[str]] = []
+			masks_possible: list[int] = []
 			current_time = 0
 			
 			# get initial segment line & transit times
-			for index, station1 in enumerate(candidate_path[:-1]):
-				station2 = candidate_path[index + 1]
-				
-				lines_possible.append(self[station1][station2]['lines'])
+			for station1, station2 in zip(candidate_path, candidate_path[1:]):
+				masks_possible.append(self.segment_mask(station1, station2))
 				current_time += self[station1][station2]['travel_time']
 			
 			# condensed
-			lines_used = self.minimize_changes(lines_possible)
-			lines_in_paths.append(lines_used)
+			masks_used = self.minimize_mask_changes(masks_possible)
+			lines_in_paths.append([set(registry.lines(mask)) for mask in masks_used])
+			if metrics.enabled:
+				start = metrics.since('minimize_changes', start)
 			
 			# calculate transfer times
 			previous_type = None
-			for line in lines_used:
+			for mask in masks_used:
 				'''
-				Although technically a line can be of multiple types, we take the 1st one
-				as a simplification. The conflicts themselves can be seen by running
+				Although technically a line can be of multiple types, we take the type of the
+				1st loaded line as a simplification. The conflicts themselves can be seen by
+				running
 				
 				load_default_graph(verbose_loading=True)
 				
 				TODO: see specific behavior of this
 				'''
-				current_type = self.detect_line_type(next(iter(line)))
+				current_type = registry.first_type(mask)
 				
 				if previous_type is None:
 					previous_type = current_type
@@ -224,26 +665,238 @@ class TransitGraph(nx.Graph):
 					else:
 						current_time += 1
 				
-				current_time += self.segment_wait_time(line)
+				current_time += registry.wait_time(mask)
 			
 			total_times.append(current_time)
+			if metrics.enabled:
+				start = metrics.since('wait_scoring', start)
 			
 		return lines_in_paths, total_times, top_paths
 		
+	def line_expanded_search(self,
+		source: str,
+		target: str = None,
+		lower_bounds: dict[str, float] = None,
+		targets: set[str] = None
+	) -> tuple[dict[str, tuple], dict[tuple, tuple]]:
+		"""
+		Dijkstra search over (station, lines) states, where `lines` is the set of lines of a
+		single type that could have been ridden continuously since the last transfer. Riding on
+		keeps only the lines that also serve the next segment, boarding or transferring starts
+		a new set with all lines of that type on the segment. Transferring is tried even where
+		riding on is possible, since the wider set can wait less than the transfer costs. The
+		costs are the same as in `self.fastest_paths`, but are paid on the edges of the search:
+		
+		* travel_time : The travel time of every segment.
+		
+		*
+			wait time : `self.segment_wait_time` of the current set of lines. Since narrowing
+			the set can only increase the wait time, only the difference is added when riding
+			on, which keeps all costs positive.
+			
+		* transfer : 1 minute if both lines are of the same type, otherwise 2 minutes.
+		
+		:param source: The source station
+		:param target: Optional target station, which stops the search once it is reached. If
+			left empty, every reachable station is labelled.
+		:param lower_bounds: Lower bounds of the remaining time from each station to the
+			target, which turn the search into A*. The bounds must never exceed the travel time
+			of a segment plus the bound of its other end, such as `self.landmark_bounds`. Only
+			the label of the target is then guaranteed to be the fastest.
+		:param targets: Optional target stations, which stop the search once all of them are
+			reached. Only their labels are then complete.
+		:return: A tuple of the following information:
+			(1) A dictionary of station -> (time, state) for the best state at each station.
+			(2) The parent of each state, used by `self.line_expanded_route`.
+		:raise nx.NodeNotFound: If the source or target is not in the graph.
+		"""
+		for station in [source, target]:
+			if station is not None and not self.has_station(station):
+				raise nx.NodeNotFound(f'Station {station} is not in the graph')
+		
+		start = (source, None)
+		best_times = {start: 0.0}
+		parents = {start: None}
+		labels = {}
+		# the counter breaks ties between equal times, so states themselves are never compared
+		tie_breaker = count()
+		# ordered by the time plus the lower bound of the station, which is 0 for Dijkstra
+		queue = [(0.0, next(tie_breaker), 0.0, start, None)]
+		measure = self.metrics.enabled
+		settled = 0
+		remaining = None if targets is None else set(targets) - {source}
+		
+		while queue:
+			_, _, time, state, state_type = heappop(queue)
+			if time > best_times[state]:
+				continue
+			if measure:
+				settled += 1
+			station, lines = state
+			if station not in labels:
+				labels[station] = (time, state)
+				if station == target:
+					break
+				if remaining is not None:
+					remaining.discard(station)
+					if not remaining:
+						break
+			
+			wait_current = 0 if lines is None else self._lines_wait_time(lines)
+			for neighbor, segment in self.adj[station].items():
+				segment_lines = segment['lines']
+				if self.disruption_log:
+					segment_lines = self.segment_lines(station, neighbor)
+					if not segment_lines:
+						continue
+				
+				for line_type, type_lines in self._lines_by_type(segment_lines):
+					continued_lines = None if lines is None else lines & type_lines
+					moves = []
+					if continued_lines:
+						# ride on, paying only the extra wait of the remaining lines
+						moves.append((
+							(neighbor, continued_lines),
+							time + segment['travel_time'] + self._lines_wait_time(continued_lines) - wait_current,
+							False
+						))
+					if continued_lines != type_lines:
+						# transfer onto all lines of the type, whose wait can undercut riding on
+						next_time = time + segment['travel_time'] + self._lines_wait_time(type_lines)
+						if lines is not None:
+							next_time += 1 if line_type == state_type else 2
+						moves.append(((neighbor, type_lines), next_time, True))
+					
+					for next_state, next_time, transfer in moves:
+						if next_time < best_times.get(next_state, float('inf')):
+							best_times[next_state] = next_time
+							parents[next_state] = (state, transfer)
+							priority = next_time if lower_bounds is None else next_time + lower_bounds[neighbor]
+							heappush(queue, (priority, next(tie_breaker), next_time, next_state, line_type))
+		
+		if measure:
+			self.metrics.count('states_settled', settled)
+		return labels, parents
+	
+	def landmarks(self) -> tuple[dict[str, int], np.ndarray]:
+		"""
+		Travel time distances between every station & `self.landmark_count` landmark stations
+		of the undisrupted graph, computed on first use. The landmarks are picked by farthest
+		point sampling: each new landmark is the station farthest from all previous ones, which
+		spreads them along the edges of the network.
+		:return: The row of each station & its distance to each landmark as a column, with
+			infinity for unreachable landmarks.
+		"""
+		if self._landmarks is None:
+			stations = list(self.nodes)
+			rows = {station: index for index, station in enumerate(stations)}
+			distances = np.full((len(stations), min(self.landmark_count, len(stations))), np.inf)
+			
+			landmark = min(stations) if stations else None
+			for column in range(distances.shape[1]):
+				for station, distance in nx.single_source_dijkstra_path_length(
+					self, landmark, weight='travel_time'
+				).items():
+					distances[rows[station], column] = distance
+				# the next landmark is the reachable station farthest from all landmarks so far
+				nearest = distances[:, :column + 1].min(axis=1)
+				nearest[np.isinf(nearest)] = -1
+				landmark = stations[int(nearest.argmax())]
+			self._landmarks = rows, distances
+		return self._landmarks
+	
+	def landmark_bounds(self, target: str) -> dict[str, float]:
+		"""
+		Lower bounds of the time from every station to a target, for `astar` routing. By the
+		triangle inequality, the travel time between 2 stations is at least the difference of
+		their distances to any landmark. Every segment of a journey costs at least its travel
+		time, so these bounds never overestimate, even while disrupted.
+		:param target: The target station
+		"""
+		rows, distances = self.landmarks()
+		to_target = distances[rows[target]]
+		finite = np.isfinite(distances) & np.isfinite(to_target)
+		with np.errstate(invalid='ignore'):
+			differences = np.where(finite, np.abs(distances - to_target), 0)
+		return dict(zip(rows, differences.max(axis=1).tolist()))
+	
+	def line_expanded_route(self,
+		state: tuple,
+		parents: dict[tuple, tuple]
+	) -> tuple[list[set[str]], list[str]]:
+		"""
+		Reconstructs a journey found by `self.line_expanded_search`.
+		:param state: The final state of the journey, as stored in the labels of the search.
+		:param parents: The parents returned by the search.
+		:return: The lines used in the journey as a list of sets & the list of stations.
+		"""
+		stations = []
+		lines_used = []
+		leg_closed = True
+		while parents[state] is not None:
+			station, lines = state
+			stations.append(station)
+			# the set of a leg is narrowest at its last state
+			if leg_closed:
+				lines_used.append(set(lines))
+			state, leg_closed = parents[state]
+		stations.append(state[0])
+		
+		stations.reverse()
+		lines_used.reverse()
+		return lines_used, stations
+	
+	def _lines_by_type(self, lines: set[str]) -> tuple[tuple[str, frozenset], ...]:
+		"""
+		Splits the lines of a segment by line type, cached per set of lines.
+		"""
+		key = frozenset(lines)
+		if self.metrics.enabled:
+			self.metrics.cache_access('type_groups', key in self._type_groups)
+		if key not in self._type_groups:
+			groups = {}
+			for line in sorted(key):
+				groups.setdefault(self._line_type(line), set()).add(line)
+			self._type_groups[key] = tuple(
+				(line_type, frozenset(group)) for line_type, group in groups.items()
+			)
+		return self._type_groups[key]
+	
+	def _lines_wait_time(self, lines: frozenset) -> float:
+		"""
+		Cached version of `self.segment_wait_time`.
+		"""
+		if self.metrics.enabled:
+			self.metrics.cache_access('segment_wait_times', lines in self._wait_cache)
+		if lines not in self._wait_cache:
+			self._wait_cache[lines] = self.segment_wait_time(lines)
+		return self._wait_cache[lines]
+	
+	def _line_type(self, line_name: str) -> str:
+		"""
+		The type of a line as loaded by `self.add_lines`, falling back to automatic detection.
+		"""
+		if line_name in self.line_types:
+			return self.line_types[line_name]
+		return self.detect_line_type(line_name)
+	
 	def fastest_path(self,
 		source: str,
 		target: str,
-		sim_mode: bool = False
+		sim_mode: bool = False,
+		method: str = None
 	) -> tuple[list[set[str]], float, list[str]]:
 		"""
-		Finds the fastest path between a source & target station. This partially uses the
-		implementation `networkx.shortest_simple_paths` by taking the travel_time for a segment
-		as the weight. The transfer times between lines is then manually calculated.
+		Finds the fastest path between a source & target station. By default this partially
+		uses the implementation `networkx.shortest_simple_paths` by taking the travel_time for a
+		segment as the weight. The transfer times between lines is then manually calculated.
+		Other methods are described in `self.routing_methods`.
 		
 		:param source: The source station
 		:param target: The target station
 		:param sim_mode: Internal parameter for running simulations, which skips checking
 			possible matches for missing nodes.
+		:param method: The routing method to use, defaults to `self.routing`.
 		:return: A tuple of the following information:
 			(1) The lines used in the journey as a list of sets.
 			(2) The calculated total time for this journey.
@@ -251,13 +904,101 @@ class TransitGraph(nx.Graph):
 		"""
 
 		if not sim_mode:
-			if not self.has_node(source):
-				find_possible_match(source, list(self.nodes))
+			if not self.has_station(source):
+				find_possible_match(source, self.stations(), index=self.station_index())
 				return list(), float(), list()
-			if not self.has_node(target):
-				find_possible_match(target, list(self.nodes))
+			if not self.has_station(target):
+				find_possible_match(target, self.stations(), index=self.station_index())
 				return list(), float(), list()
 		
+		if method is None:
+			method = self.routing
+		
+		if self.metrics.enabled:
+			return self._measured_fastest_path(source, target, method)
+		return self._fastest_path(source, target, method)
+	
+	def _measured_fastest_path(self,
+		source: str,
+		target: str,
+		method: str
+	) -> tuple[list[set[str]], float, list[str]]:
+		"""
+		`self._fastest_path` while collecting `self.metrics`. Every query is counted & timed
+		per method, & the networkx exceptions of impossible journeys are counted by type before
+		being raised again. The trace hook of the metrics receives a dictionary of the source,
+		target, method, duration in seconds, the paths enumerated by `heuristic` routing & the
+		resulting journey time or the name of the exception.
+		"""
+		metrics = self.metrics
+		paths_enumerated = metrics.counters.get('paths_enumerated', 0)
+		metrics.count(f'queries_{method}')
+		start = perf_counter()
+		
+		error = None
+		try:
+			result = self._fastest_path(source, target, method)
+		except nx.NetworkXNoPath as exception:
+			metrics.count('no_path')
+			error = exception
+		except nx.NodeNotFound as exception:
+			metrics.count('node_not_found')
+			error = exception
+		
+		seconds = perf_counter() - start
+		metrics.add_time(f'route_{method}', seconds)
+		if metrics.trace is not None:
+			metrics.trace({
+				'source': source,
+				'target': target,
+				'method': method,
+				'seconds': seconds,
+				'paths_enumerated': metrics.counters.get('paths_enumerated', 0) - paths_enumerated,
+				'time': None if error is not None else result[1],
+				'error': type(error).__name__ if error is not None else None,
+			})
+		
+		if error is not None:
+			raise error
+		return result
+	
+	def _fastest_path(self,
+		source: str,
+		target: str,
+		method: str
+	) -> tuple[list[set[str]], float, list[str]]:
+		"""
+		Routes with a specific method, see `self.fastest_path` for docs.
+		"""
+		if method == 'table':
+			if self.route_table is None:
+				raise ValueError('No route table loaded, see `self.load_route_table`')
+			if self.metrics.enabled:
+				self.metrics.cache_access('route_table', not self.disruption_log)
+			# the table only holds undisrupted journeys, which it was built from
+			if not self.disruption_log:
+				return self.route_table.route(source, target)
+			method = 'line_expanded'
+		
+		if method == 'csr':
+			return self.compact_graph().fastest_path(source, target, *self._current_compact_overlay())
+		elif method == 'raptor':
+			journeys = self.pareto_journeys_from(source, [target])
+			if target not in journeys:
+				raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+			lines, time, stations, _ = journeys[target][-1]
+			return lines, time, stations
+		elif method in ['line_expanded', 'astar']:
+			lower_bounds = self.landmark_bounds(target) if method == 'astar' else None
+			labels, parents = self.line_expanded_search(source, target, lower_bounds)
+			if target not in labels:
+				raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+			time, state = labels[target]
+			lines, stations = self.line_expanded_route(state, parents)
+			return lines, time, stations
+		elif method != 'heuristic':
+			raise ValueError(f'Unknown routing method {method}, use one of {self.routing_methods}')
+		
 		lines_in_paths, total_times, top_paths = self.fastest_paths(source, target)
 		
 		fastest_index = total_times.index(min(total_times))
@@ -267,12 +1008,167 @@ class TransitGraph(nx.Graph):
 			total_times[fastest_index], \
 			top_paths[fastest_index]
 			
-	def print_fastest_path(self, source: str, target: str, paths_before_transfers: int = 6):
+	def fastest_paths_from(self,
+		source: str,
+		targets: list[str],
+		method: str = None
+	) -> dict[str, tuple[list[set[str]], float, list[str]]]:
+		"""
+		Routes from a single source to many targets, in the format of `self.fastest_path`. The
+		`line_expanded`, `csr` & `raptor` methods answer all targets with a single search,
+		which stops once every target is reached. `astar` does so as `line_expanded` from
+		`self.astar_group_targets` targets on, since its lower bounds only hold for a single
+		target. A single target, & every target of all other methods, is routed on its own.
+		
+		Collected metrics count every target as a query of the method. The trace hook receives
+		every target as well, with the time of the shared search split evenly among them.
+		:param source: The source station
+		:param targets: The target stations
+		:param method: The routing method to use, defaults to `self.routing`.
+		:return: The journey to each target that can be reached. Removed targets are left out.
+		:raise nx.NodeNotFound: If the source is not in the graph.
+		"""
+		if not self.has_station(source):
+			raise nx.NodeNotFound(f'Station {source} is not in the graph')
+		if method is None:
+			method = self.routing
+		if method == 'table' and self.disruption_log:
+			method = 'line_expanded'
+		targets = [target for target in targets if self.has_station(target)]
+		
+		grouped = ['line_expanded', 'csr', 'raptor']
+		if len(targets) >= self.astar_group_targets:
+			grouped.append('astar')
+		
+		if method not in grouped or len(targets) <= 1:
+			journeys = {}
+			for target in targets:
+				try:
+					journeys[target] = self.fastest_path(source, target, sim_mode=True, method=method)
+				except nx.NetworkXNoPath:
+					pass
+			return journeys
+		
+		if self.metrics.enabled:
+			start = perf_counter()
+		
+		if method == 'csr':
+			compact = self.compact_graph()
+			labels, parents = compact.search(
+				compact.station_ids[source], -1, *self._current_compact_overlay(),
+				targets={compact.station_ids[target] for target in targets}
+			)
+			journeys = {}
+			for target in targets:
+				target_id = compact.station_ids[target]
+				if target_id in labels:
+					time, state = labels[target_id]
+					lines, stations = compact.route(state, parents)
+					journeys[target] = (lines, time, stations)
+		elif method == 'raptor':
+			journeys = {
+				target: options[-1][:3]
+				for target, options in self.pareto_journeys_from(source, targets).items()
+			}
+		else:
+			labels, parents = self.line_expanded_search(source, targets=set(targets))
+			journeys = {}
+			for target in targets:
+				if target in labels:
+					time, state = labels[target]
+					lines, stations = self.line_expanded_route(state, parents)
+					journeys[target] = (lines, time, stations)
+		
+		if self.metrics.enabled:
+			seconds = perf_counter() - start
+			self.metrics.add_time(f'route_from_{method}', seconds)
+			self.metrics.count(f'queries_{method}', len(targets))
+			self.metrics.count('no_path', len(targets) - len(journeys))
+			if self.metrics.trace is not None:
+				for target in targets:
+					self.metrics.trace({
+						'source': source,
+						'target': target,
+						'method': method,
+						'seconds': seconds / len(targets),
+						'paths_enumerated': 0,
+						'time': journeys[target][1] if target in journeys else None,
+						'error': None if target in journeys else 'NetworkXNoPath',
+					})
+		return journeys
+	
+	def _current_compact_overlay(self) -> tuple[set[int], dict[int, int]]:
+		"""
+		The disruptions translated for `self.compact_graph`, cached until they change.
+		"""
+		if self.metrics.enabled:
+			self.metrics.cache_access('compact_overlay', self._compact_overlay is not None)
+		if self._compact_overlay is None:
+			self._compact_overlay = self.compact_graph().overlay(
+				self.removed_stations, self.removed_segments, self.removed_lines
+			)
+		return self._compact_overlay
+			
+	def pareto_journeys(self,
+		source: str,
+		target: str,
+		max_transfers: int = None
+	) -> list[tuple[list[set[str]], float, list[str], int]]:
+		"""
+		The trade-off between the time & the # of transfers of a journey, found by
+		`self.raptor_router`. For every # of transfers, the fastest journey is included if it is
+		faster than all journeys with fewer transfers.
+		:param source: The source station
+		:param target: The target station
+		:param max_transfers: The maximum # of transfers, unlimited if left empty.
+		:return: The journeys from the fewest transfers to the fastest, each in the format of
+			`self.fastest_path` followed by its # of transfers. Empty if the target cannot be
+			reached.
+		:raise nx.NodeNotFound: If the source or target is not in the graph.
+		"""
+		return self.pareto_journeys_from(source, [target], max_transfers).get(target, [])
+	
+	def pareto_journeys_from(self,
+		source: str,
+		targets: list[str] = None,
+		max_transfers: int = None
+	) -> dict[str, list[tuple[list[set[str]], float, list[str], int]]]:
+		"""
+		`self.pareto_journeys` from a single source to many targets, which only takes a single
+		search. This is much faster than routing every pair on its own.
+		:param source: The source station
+		:param targets: The target stations, all stations if left empty
+		:param max_transfers: The maximum # of transfers, unlimited if left empty.
+		:return: The journeys by target, leaving out unreachable targets.
+		:raise nx.NodeNotFound: If the source or any target is not in the graph.
+		"""
+		router = self.raptor_router()
+		if self.metrics.enabled:
+			self.metrics.cache_access('raptor_overlay', self._raptor_overlay is not None)
+		if self._raptor_overlay is None:
+			self._raptor_overlay = router.overlay(self)
+		return router.pareto_journeys(source, targets, max_transfers, *self._raptor_overlay)
+			
+	def load_route_table(self, path: str) -> None:
+		"""
+		Memory maps a route table built by `RouteTable.build_route_table` for the `table`
+		routing method.
+		:param path: The path of the route table file.
+		:raise ValueError: If the table was built from different line files.
+		"""
+		self.route_table = RouteTable(path, self.network_hash)
+	
+	def print_fastest_path(self,
+		source: str,
+		target: str,
+		paths_before_transfers: int = 6,
+		method: str = None
+	):
 		"""
 		Helper function to print out results of `self.fastest_path`. The arguments are the same
 		as this function.
 		"""
-		lines, time, stations = self.fastest_path(source, target)
+		lines, time, stations = self.fastest_path(source, target, method=method)
 		print(
 			f'\nLines used: {lines}'
 			f'\nCalculated travel time: {time}'
@@ -282,37 +1178,44 @@ class TransitGraph(nx.Graph):
 	def minimize_changes(self, possible_lines: list[set[str]]) -> list[set[str]]:
 		"""
 		Helper function that takes all available lines for a given route & determines the ideal
-		route with the least # of transfers.
+		route with the least # of transfers. The lines do not have to be loaded in the graph,
+		since they are numbered for this call only, see `self.minimize_mask_changes`.
 		:param possible_lines: A list of sets showing the available lines at each station.
 		:return: A (usually shorter) list in the same format, but only containing the ideal lines.
 		"""
-		def strip_extra_lines(possible_lines_inner: list[set[str]]) -> list[set[str]]:
+		names = sorted(set().union(*possible_lines))
+		ids = {line: line_id for line_id, line in enumerate(names)}
+		masks = [sum(1 << ids[line] for line in lines) for lines in possible_lines]
+		return [
+			{line for line_id, line in enumerate(names) if mask >> line_id & 1}
+			for mask in self.minimize_mask_changes(masks)
+		]
+	
+	def minimize_mask_changes(self, possible_masks: list[int]) -> list[int]:
+		"""
+		`self.minimize_changes` on bitmasks, such as those of `self.line_registry`.
+		:param possible_masks: The bitmask of the available lines of each segment.
+		:return: The bitmask of the ideal lines of each leg.
+		"""
+		def strip_extra_lines(possible_masks_inner: list[int]) -> list[int]:
 			"""
 			Removes unnecessary lines by traversing the list in a single direction & keeping
 			only the lines serving the longest continuous segment.
 			"""
 			# add first segment to total lines
-			total_lines = [possible_lines_inner[0]]
+			total_masks = [possible_masks_inner[0]]
 			# go through the rest of the journey
-			for next_lines in possible_lines_inner[1:]:
+			for next_mask in possible_masks_inner[1:]:
 				# if the next segment has different lines
-				if total_lines[-1] != next_lines:
-					# 1st create a duplicate of the current lines for reconsideration
-					total_lines.append(deepcopy(total_lines[-1]))
-					# create a duplicate of that for iteration
-					considered_lines = deepcopy(total_lines[-1])
-					# delete any that do not appear in the next segment
-					for line in considered_lines:
-						if line not in next_lines:
-							total_lines[-1].remove(line)
-					# if there are no continued lines, add all lines from the next segment
-					if len(total_lines[-1]) == 0:
-						total_lines[-1] = next_lines
-
-			return total_lines
+				if total_masks[-1] != next_mask:
+					# keep the current lines that continue into the next segment, or if there
+					# are no continued lines, all lines from the next segment
+					total_masks.append(total_masks[-1] & next_mask or next_mask)
+			
+			return total_masks
 		
 		# remove unnecessary lines in both directions
-		input_path = strip_extra_lines(possible_lines)
+		input_path = strip_extra_lines(possible_masks)
 		input_path.reverse()
 		input_path = strip_extra_lines(input_path)
 		input_path.reverse()
@@ -337,13 +1240,16 @@ class TransitGraph(nx.Graph):
 		trains_per_hour = 0
 		# count number of trains coming per hour
 		for line in lines:
-			if line in self.wait_times_exceptions:
-				wait = self.wait_times_exceptions[line]
-			else:
-				wait = self.wait_times[self.detect_line_type(line)]
-				
-			trains_per_hour += (60 / wait)
+			trains_per_hour += (60 / self.line_wait_time(line))
 		
 		# half the wait time (30 instead of 60) to get the average instead of maximum
 		return 30 / trains_per_hour
-
+	
+	def line_wait_time(self, line: str) -> float:
+		"""
+		The interval of a single line, taken from `self.wait_times_exceptions` or otherwise
+		`self.wait_times` of its type.
+		"""
+		if line in self.wait_times_exceptions:
+			return self.wait_times_exceptions[line]
+		return self.wait_times[self._line_type(line)]